@@ -1,12 +1,43 @@
+import asyncio
+import collections
 import pigpio
+import threading
 import time
 
+from am2302_decode import (  # noqa: F401 - exceptions are re-exported
+    AM2302_SCALE_FACTOR,
+    AM2302ChecksumFailed,
+    AM2302InsufficientDataRecieved,
+    AM2302NoData,
+    decodeEdgeTicksToBytes,
+    isChecksumValid,
+    shortFramePayloadCandidates,
+    validateEdgeCount,
+    verifyPayloadChecksum,
+)
+from am2302_notify import AM2302NotificationCapture
+
 SENSOR_PIN = 19
 sendStartTimeMs = 1.5
 initTimeMs = 0.5
 MS_TO_S = 1.0 / 1000.0
-AM2302_SCALE_FACTOR = 1.0 / 10.0
 MIN_TIME_BETWEEN_READS_S = 2.0
+N_EXPECTED_EDGES = 42
+# a full transmission lasts ~5 ms; allow generous slack for callback delivery
+EDGE_COLLECTION_TIMEOUT_S = (160e-6 + 41.0 * 120e-6) * 10
+# longest gap between consecutive falling edges is ~130 us, so a quiet line
+# for this long means the sensor has stopped sending
+EDGE_IDLE_TIMEOUT_S = 5e-3
+N_LATENCIES_KEPT = 100
+# edge capture backends: a python callback per edge, or bulk reads of the
+# pigpio notification pipe (only available on the Pi itself)
+CALLBACK_CAPTURE = "callback"
+NOTIFY_CAPTURE = "notify"
+# each retry waits this much longer than the last, starting at the sensor's
+# minimum interval
+RETRY_BACKOFF_FACTOR = 1.5
+MAX_RETRY_DELAY_S = 10.0
+N_OUTCOMES_KEPT = 100
 
 
 class PiConnectionError(Exception):
@@ -15,34 +46,137 @@ class PiConnectionError(Exception):
     pass
 
 
-class AM2302InsufficientDataRecieved(Exception):
-    """Raised when too few edges are detected when reading AM2302."""
-
-    pass
+class AM2302ReadStats:
+    """Outcome counters for an AM2302Reader, over all time and recent reads.
+
+    Rates are over the last N_OUTCOMES_KEPT read attempts, retries included, so
+    a degrading sensor shows up even after a long healthy history. A read is
+    classified by how it ended, so a 41-edge frame that still decodes counts as
+    a success; edgeCounts keeps the raw number of edges each read captured.
+    """
+
+    SUCCESS = "success"
+    CHECKSUM_FAILED = "checksumFailed"
+    SHORT_FRAME = "shortFrame"
+    NO_DATA = "noData"
+    OTHER_ERROR = "otherError"
+
+    def __init__(self, window=N_OUTCOMES_KEPT):
+        self.recentOutcomes = collections.deque(maxlen=window)
+        self.totals = collections.Counter()
+        self.retries = 0
+        self.recoveredShortFrames = 0  # 41-edge frames saved by re-decoding
+        self.edgeCounts = collections.Counter()  # reads seen per edge count
+
+    def record(self, outcome):
+        self.recentOutcomes.append(outcome)
+        self.totals[outcome] += 1
+
+    def recordError(self, error):
+        if isinstance(error, AM2302NoData):
+            self.record(self.NO_DATA)
+        elif isinstance(error, AM2302InsufficientDataRecieved):
+            self.record(self.SHORT_FRAME)
+        elif isinstance(error, AM2302ChecksumFailed):
+            self.record(self.CHECKSUM_FAILED)
+        else:
+            self.record(self.OTHER_ERROR)
 
+    def rate(self, outcome):
+        if not self.recentOutcomes:
+            return None
+        return self.recentOutcomes.count(outcome) / len(self.recentOutcomes)
 
-class AM2302ChecksumFailed(Exception):
-    """Raised when checksum does not match payload from AM2302."""
+    @property
+    def successRate(self):
+        return self.rate(self.SUCCESS)
 
-    pass
+    @property
+    def checksumFailureRate(self):
+        return self.rate(self.CHECKSUM_FAILED)
 
+    @property
+    def shortFrameRate(self):
+        return self.rate(self.SHORT_FRAME)
 
-class AM2302NoData(Exception):
-    """No falling edges are available, likely because sensor hasn't been read."""
+    @property
+    def noDataRate(self):
+        return self.rate(self.NO_DATA)
+
+    def snapshot(self):
+        return {
+            "attempts": sum(self.totals.values()),
+            "totals": dict(self.totals),
+            "retries": self.retries,
+            "recoveredShortFrames": self.recoveredShortFrames,
+            "edgeCounts": dict(sorted(self.edgeCounts.items())),
+            "successRate": self.successRate,
+            "checksumFailureRate": self.checksumFailureRate,
+            "shortFrameRate": self.shortFrameRate,
+            "noDataRate": self.noDataRate,
+        }
+
+    def __repr__(self):
+        return "AM2302ReadStats({})".format(self.snapshot())
+
+
+class AM2302Reading(
+    collections.namedtuple(
+        "AM2302Reading", ["temperatureF", "relativeHumidity", "timestampS"]
+    )
+):
+    """A validated reading, stamped with CLOCK_MONOTONIC time of the request."""
+
+    __slots__ = ()
 
-    pass
+    @property
+    def ageS(self):
+        return time.clock_gettime(time.CLOCK_MONOTONIC) - self.timestampS
 
 
 class AM2302Reader:
-    def __init__(self):
-        self.gpio = None  # gpio control object provided by pigpio
+    def __init__(
+        self, pin=SENSOR_PIN, gpio=None, captureBackend=CALLBACK_CAPTURE, maxRetries=0
+    ):
+        """
+        Args:
+            pin (int): BCM GPIO number the sensor's data line is attached to
+            gpio (pigpio.pi): an existing pigpio connection to share; if None
+                the reader opens, and later stops, its own connection
+            captureBackend (str): CALLBACK_CAPTURE or NOTIFY_CAPTURE
+            maxRetries (int): extra attempts readSensor makes after a faulty
+                transmission before raising
+        """
+        if captureBackend not in (CALLBACK_CAPTURE, NOTIFY_CAPTURE):
+            raise ValueError("Unknown capture backend {}".format(captureBackend))
+        self.pin = pin
+        self.gpio = gpio  # gpio control object provided by pigpio
+        self.ownsGpio = gpio is None
+        self.captureBackend = captureBackend
+        self.notificationCapture = None
+        self.maxRetries = maxRetries
+        self.stats = AM2302ReadStats()
         self.piGpioCallback = None
         self.fallingEdgeTimesUs = []
         self.checksum = None
         self.temperatureF = None
         self.relativeHumidity = None
         self.lastRequestTimeS = None
+        self.startSignalTickUs = None
+        # datasheet minimum; only lowered when replaying recorded captures
+        self.minTimeBetweenReadsS = MIN_TIME_BETWEEN_READS_S
         self.validatedPayloadAvailable = False
+        self.expectedEdgeCount = N_EXPECTED_EDGES
+        self.edgesReceived = threading.Event()
+        self.lastReadLatencyS = None
+        self.readLatenciesS = collections.deque(maxlen=N_LATENCIES_KEPT)
+        self.latestReading = None
+        self.samplingThread = None
+        self.stopSamplingEvent = threading.Event()
+        self.samplingErrorCount = 0
+        self.lastSamplingError = None
+        self.readingWaiters = []  # (event loop, future) pairs awaiting a reading
+        self.readingWaitersLock = threading.Lock()
 
     def __enter__(self):
         return self
@@ -62,26 +196,200 @@ class AM2302Reader:
         Raises:
             PiConnectionError: If a connection to pigpio cannot be established.
         """
+        if not self.ownsGpio:
+            raise PiConnectionError("Shared pigpio connection is not connected")
         self.gpio = pigpio.pi()
         if not self.gpio.connected:
             raise PiConnectionError("Failed to connect to pigpio")
 
     def cleanUpGpio(self):
         """Clean up GPIO state"""
+        self.stopSampling()
         if self.piGpioCallback is not None:
             self.piGpioCallback.cancel()
+        if self.notificationCapture is not None:
+            self.notificationCapture.close()
+            self.notificationCapture = None
         if self.connectedToGpio:
-            self.gpio.set_mode(SENSOR_PIN, pigpio.INPUT)
-            self.gpio.stop()
+            self.gpio.set_mode(self.pin, pigpio.INPUT)
+            if self.ownsGpio:
+                self.gpio.stop()
 
     def readSensor(self):
+        """Read the sensor, retrying faulty transmissions up to maxRetries times.
+
+        Retries back off from the sensor's minimum interval. A 41-edge frame
+        that fails its checksum is first re-decoded under the other ways an
+        edge could have gone missing before it counts as a failure.
+
+        Raises:
+            AM2302NoData, AM2302InsufficientDataRecieved, AM2302ChecksumFailed:
+                if the last attempt still fails
+        """
+        attempt = 0
+        while True:
+            try:
+                self.readSensorOnce()
+            except (
+                AM2302NoData,
+                AM2302InsufficientDataRecieved,
+                AM2302ChecksumFailed,
+            ) as e:
+                self.stats.recordError(e)
+                if attempt >= self.maxRetries:
+                    raise
+                attempt += 1
+                self.stats.retries += 1
+                self.waitBeforeRetry(attempt)
+            except Exception as e:
+                self.stats.recordError(e)
+                raise
+            else:
+                self.stats.record(AM2302ReadStats.SUCCESS)
+                return
+
+    def readSensorOnce(self):
         if self.lastRequestTimeS:
             tElapsedS = time.clock_gettime(time.CLOCK_MONOTONIC) - self.lastRequestTimeS
-            if tElapsedS < MIN_TIME_BETWEEN_READS_S:
-                time.sleep(MIN_TIME_BETWEEN_READS_S - tElapsedS)
+            if tElapsedS < self.minTimeBetweenReadsS:
+                time.sleep(self.minTimeBetweenReadsS - tElapsedS)
         self.clearPreviousRead()
         self.getDataFromSensor()
-        self.processSensorData()
+        try:
+            self.processSensorData()
+        except AM2302ChecksumFailed:
+            if not self.recoverShortFrame():
+                raise
+
+    def waitBeforeRetry(self, attempt):
+        delayS = min(
+            self.minTimeBetweenReadsS * RETRY_BACKOFF_FACTOR ** (attempt - 1),
+            MAX_RETRY_DELAY_S,
+        )
+        waitS = (
+            self.lastRequestTimeS + delayS - time.clock_gettime(time.CLOCK_MONOTONIC)
+        )
+        if waitS > 0.0:
+            time.sleep(waitS)
+
+    def recoverShortFrame(self):
+        """Re-decode a 41-edge frame that failed its checksum, without re-reading.
+
+        Returns:
+            bool: True if exactly one alternative decoding passes the checksum
+        """
+        candidates = [
+            payload
+            for payload in shortFramePayloadCandidates(self.fallingEdgeTimesUs)
+            if isChecksumValid(payload)
+        ]
+        if len(candidates) != 1:
+            return False
+        self.setChecksum(candidates[0])
+        self.relativeHumidity, self.temperatureF = self.convertBytesToPhysicalReadings(
+            candidates[0]
+        )
+        self.stats.recoveredShortFrames += 1
+        return True
+
+    def startSampling(self, periodS=MIN_TIME_BETWEEN_READS_S):
+        """Read the sensor on a background thread, caching the latest good reading.
+
+        While sampling, readSensor should not be called from other threads; use
+        getLatestReading or waitForNextReading instead.
+
+        Args:
+            periodS (float): time between reads, never less than
+                minTimeBetweenReadsS
+        """
+        if self.samplingThread is not None and self.samplingThread.is_alive():
+            return
+        self.stopSamplingEvent.clear()
+        self.samplingThread = threading.Thread(
+            target=self.sampleContinuously,
+            args=(max(periodS, self.minTimeBetweenReadsS),),
+            name="AM2302Sampling",
+            daemon=True,
+        )
+        self.samplingThread.start()
+
+    def stopSampling(self):
+        """Stop the background sampling thread, if running, and wait for it."""
+        self.stopSamplingEvent.set()
+        if (
+            self.samplingThread is not None
+            and self.samplingThread is not threading.current_thread()
+        ):
+            self.samplingThread.join()
+        self.samplingThread = None
+
+    def sampleContinuously(self, periodS):
+        while not self.stopSamplingEvent.is_set():
+            try:
+                self.readSensor()
+            except Exception as e:
+                self.samplingErrorCount += 1
+                self.lastSamplingError = e
+            else:
+                self.publishReading(
+                    AM2302Reading(
+                        self.temperatureF, self.relativeHumidity, self.lastRequestTimeS
+                    )
+                )
+            if self.lastRequestTimeS is not None:
+                nextReadS = self.lastRequestTimeS + periodS
+                self.stopSamplingEvent.wait(
+                    nextReadS - time.clock_gettime(time.CLOCK_MONOTONIC)
+                )
+            else:
+                self.stopSamplingEvent.wait(periodS)
+
+    def publishReading(self, reading):
+        """Cache a validated reading and wake anything awaiting the next one."""
+        self.latestReading = reading
+        with self.readingWaitersLock:
+            waiters, self.readingWaiters = self.readingWaiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self.resolveWaiter, future, reading)
+
+    @staticmethod
+    def resolveWaiter(future, reading):
+        if not future.done():
+            future.set_result(reading)
+
+    def getLatestReading(self, maxAgeS=None):
+        """Return the most recent validated reading without blocking.
+
+        Args:
+            maxAgeS (float): if given, readings older than this are ignored
+
+        Returns:
+            AM2302Reading: the latest reading, or None if none is available
+        """
+        reading = self.latestReading
+        if reading is None or (maxAgeS is not None and reading.ageS > maxAgeS):
+            return None
+        return reading
+
+    async def waitForNextReading(self, timeoutS=None):
+        """Wait, from an asyncio event loop, for the next fresh reading.
+
+        Args:
+            timeoutS (float): give up after this long; None waits forever
+
+        Raises:
+            asyncio.TimeoutError: if no reading arrives within timeoutS
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.readingWaitersLock:
+            self.readingWaiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeoutS)
+        finally:
+            with self.readingWaitersLock:
+                if (loop, future) in self.readingWaiters:
+                    self.readingWaiters.remove((loop, future))
 
     def clearPreviousRead(self):
         """Resets all values related to the previous read of the AM2302"""
@@ -90,6 +398,8 @@ class AM2302Reader:
         self.temperatureF = None
         self.relativeHumidity = None
         self.validatedPayloadAvailable = False
+        self.lastReadLatencyS = None
+        self.edgesReceived.clear()
 
     def getDataFromSensor(self):
         # check connection state
@@ -97,6 +407,8 @@ class AM2302Reader:
             self.connectToPigpio()
 
         # get payload from sensor
+        if self.captureBackend == NOTIFY_CAPTURE:
+            self.beginNotificationCapture()
         self.sendRequestForPayload()
         self.recievePayloadTransmission()
         self.validatePayload()
@@ -113,26 +425,40 @@ class AM2302Reader:
 
     def sendRequestForPayload(self):
         # set pin as output in high state
-        self.gpio.set_pull_up_down(SENSOR_PIN, pigpio.PUD_UP)
-        self.gpio.write(SENSOR_PIN, 1)
-        self.gpio.set_mode(SENSOR_PIN, pigpio.OUTPUT)
+        self.gpio.set_pull_up_down(self.pin, pigpio.PUD_UP)
+        self.gpio.write(self.pin, 1)
+        self.gpio.set_mode(self.pin, pigpio.OUTPUT)
         time.sleep(initTimeMs * MS_TO_S)
 
         # set output low & wait
-        self.gpio.write(SENSOR_PIN, 0)
+        self.gpio.write(self.pin, 0)
         time.sleep(sendStartTimeMs * MS_TO_S)
+        # daemon tick between our falling edge and the sensor's first one
+        self.startSignalTickUs = self.gpio.get_current_tick()
 
         # switch to input with a pull up
-        self.gpio.set_mode(SENSOR_PIN, pigpio.INPUT)
-        self.gpio.set_pull_up_down(SENSOR_PIN, pigpio.PUD_UP)
+        self.gpio.set_mode(self.pin, pigpio.INPUT)
+        self.gpio.set_pull_up_down(self.pin, pigpio.PUD_UP)
         self.lastRequestTimeS = time.clock_gettime(time.CLOCK_MONOTONIC)
 
     def recievePayloadTransmission(self):
+        """Capture falling edges with the selected backend as they arrive"""
+        if self.captureBackend == NOTIFY_CAPTURE:
+            self.recievePayloadViaNotifications()
+        else:
+            self.recievePayloadViaCallback()
+        self.stats.edgeCounts[len(self.fallingEdgeTimesUs)] += 1
+
+    def recievePayloadViaCallback(self):
         """Set up GPIO to detect falling edges and wait for them to arrive"""
 
+        # arm completion before the callback can fire
+        self.expectedEdgeCount = N_EXPECTED_EDGES
+        self.edgesReceived.clear()
+
         # check that we recently requested a payload
         self.piGpioCallback = self.gpio.callback(
-            SENSOR_PIN, pigpio.FALLING_EDGE, self.respondToEdge
+            self.pin, pigpio.FALLING_EDGE, self.respondToEdge
         )
         if time.clock_gettime(time.CLOCK_MONOTONIC) - self.lastRequestTimeS > 270e-6:
             self.piGpioCallback.cancel()
@@ -143,24 +469,78 @@ class AM2302Reader:
 
         # DHT22 datasheet suggests minimum time between subsequent reads should
         # be 2 seconds
-        self.collectNEdges(42)
+        self.collectNEdges(N_EXPECTED_EDGES)
         self.piGpioCallback.cancel()
 
-    def collectNEdges(self, nEdges):
-        T_MAX = (160e-6 + 41.0 * 120e-6) * 10
-        try:
-            for attempt in range(2):
-                if len(self.fallingEdgeTimesUs) >= nEdges:
-                    break
-                else:
-                    time.sleep(T_MAX)
-        except KeyboardInterrupt:
-            raise
+    def beginNotificationCapture(self):
+        """Start recording the pin's level changes before the start signal.
+
+        The notification handle and pipe are opened on the first read and kept
+        open, so nothing slow happens between the start signal and the frame.
+        """
+        if self.notificationCapture is None:
+            capture = AM2302NotificationCapture(self.gpio, self.pin)
+            capture.open()
+            self.notificationCapture = capture
+        self.notificationCapture.begin()
+
+    def recievePayloadViaNotifications(self):
+        """Decode the level changes recorded in the daemon in bulk
+
+        Recording started before the start signal, so there is no race with the
+        sensor's first edge; our own falling edge is dropped by its tick.
+        """
+        self.fallingEdgeTimesUs = self.notificationCapture.collectFallingEdges(
+            N_EXPECTED_EDGES,
+            self.lastRequestTimeS,
+            EDGE_COLLECTION_TIMEOUT_S,
+            EDGE_IDLE_TIMEOUT_S,
+            self.startSignalTickUs,
+        )
+        self.recordReadLatency()
+
+    def collectNEdges(self, nEdges, timeoutS=EDGE_COLLECTION_TIMEOUT_S):
+        """Block until nEdges falling edges arrive, the line goes idle or we time out.
+
+        Records the time from the end of the start signal to completion in
+        lastReadLatencyS and readLatenciesS.
+
+        Args:
+            nEdges (int): number of edges that completes a transmission
+            timeoutS (float): deadline, measured from now, for the transmission
+
+        Returns:
+            bool: True if all nEdges edges were received before the deadline
+        """
+        self.expectedEdgeCount = nEdges
+        if len(self.fallingEdgeTimesUs) >= nEdges:
+            self.edgesReceived.set()
+        deadlineS = time.clock_gettime(time.CLOCK_MONOTONIC) + timeoutS
+        while not self.edgesReceived.is_set():
+            remainingS = deadlineS - time.clock_gettime(time.CLOCK_MONOTONIC)
+            if remainingS <= 0.0:
+                break
+            nEdgesSeen = len(self.fallingEdgeTimesUs)
+            if self.edgesReceived.wait(min(remainingS, EDGE_IDLE_TIMEOUT_S)):
+                break
+            # the sensor has stopped sending, e.g. after a missed edge
+            if nEdgesSeen > 0 and len(self.fallingEdgeTimesUs) == nEdgesSeen:
+                break
+
+        self.recordReadLatency()
+        return self.edgesReceived.is_set()
+
+    def recordReadLatency(self):
+        self.lastReadLatencyS = (
+            time.clock_gettime(time.CLOCK_MONOTONIC) - self.lastRequestTimeS
+        )
+        self.readLatenciesS.append(self.lastReadLatencyS)
 
     def respondToEdge(self, channel: int, level: bool, tickUs: int):
         """Callback function when an edge event is detected.
 
-        Appends the edge time to an internal buffer.
+        Appends the edge time to an internal buffer and signals completion once
+        the expected number of edges has arrived.
 
         Args:
             channel (int): pin number where event was detected
@@ -168,90 +548,72 @@ class AM2302Reader:
             tickUs (int): clock time in microseconds when event was detected
         """
         self.fallingEdgeTimesUs.append(tickUs)
+        if len(self.fallingEdgeTimesUs) >= self.expectedEdgeCount:
+            self.edgesReceived.set()
 
     def validatePayload(self):
         # validate the data returned
-        if len(self.fallingEdgeTimesUs) == 0:
-            raise AM2302NoData("Didn't get any data from sensor.")
-        elif len(self.fallingEdgeTimesUs) < 41:
-            raise AM2302InsufficientDataRecieved(
-                "Only received {} of 40 bits from sensor, try again.".format(
-                    len(self.fallingEdgeTimesUs) - 2
-                )
-            )
-        elif len(self.fallingEdgeTimesUs) == 41:
-            print("Warning: missed one edge - usually is the first; verify checksum")
-            self.validatedPayloadAvailable = True
-        elif len(self.fallingEdgeTimesUs) > 42:
-            raise AM2302InsufficientDataRecieved(
-                "Received {} of expected 40 bits from sensor, try again.".format(
-                    len(self.fallingEdgeTimesUs) - 2
-                )
-            )
-        else:
-            self.validatedPayloadAvailable = True
+        validateEdgeCount(len(self.fallingEdgeTimesUs))
+        self.validatedPayloadAvailable = True
 
     def convertEdgeTimesIntoBytes(self):
-        pulseDurationsUs = [
-            t - s for s, t in zip(self.fallingEdgeTimesUs, self.fallingEdgeTimesUs[1:])
-        ]
-        # each pulse has a 50us low, followed by high of ~25us for 0, 75us for 1
-        bits = ["1" if tDeltaUs > 100 else "0" for tDeltaUs in pulseDurationsUs]
-
-        # the first pulse is the start signal from sensor - sometimes it is missed
-        if len(bits) == 41:
-            bits.pop(0)
-
-        # assert that we have 40 bits, otherwise something has gone wrong
-        try:
-            assert len(bits) == 40
-        except AssertionError:
+        payload, frameValid = decodeEdgeTicksToBytes(
+            [self.fallingEdgeTimesUs[:N_EXPECTED_EDGES]],
+            [len(self.fallingEdgeTimesUs)],
+        )
+        if not frameValid[0]:
             raise Exception(
-                "Had {} bits instead of 40 while decoding payload".format(len(bits))
+                "Had {} edges instead of 41 or 42 while decoding payload".format(
+                    len(self.fallingEdgeTimesUs)
+                )
             )
-
-        return [int("".join(bits[i : i + 8]), 2) for i in range(0, len(bits), 8)]
+        return [int(byte) for byte in payload[0]]
 
     def convertBytesToPhysicalReadings(self, bytes):
         relativeHumidity = ((bytes[0] << 8) + bytes[1]) * AM2302_SCALE_FACTOR
-        temperatureF = (
-            ((bytes[2] & 0x7F) << 8) + bytes[3]
-        ) * AM2302_SCALE_FACTOR * 9.0 / 5.0 + 32.0
+        temperatureC = (((bytes[2] & 0x7F) << 8) + bytes[3]) * AM2302_SCALE_FACTOR
         if bytes[2] & 0x80:
-            temperatureF *= -1.0
-        return relativeHumidity, temperatureF
+            temperatureC *= -1.0
+        return relativeHumidity, temperatureC * 9.0 / 5.0 + 32.0
 
     def setChecksum(self, bytes):
         self.checksum = bytes[4]
 
     def verifyChecksum(self, bytes):
-        try:
-            assert (sum(bytes[:4]) & 0xFF) == self.checksum
-        except AssertionError:
-            raise AM2302ChecksumFailed(
-                "Failed checksum verification {} != {}".format(
-                    bin(sum(bytes[:4]) & 0xFF), bin(self.checksum)
-                )
-            )
+        verifyPayloadChecksum(list(bytes[:4]) + [self.checksum])
 
     @property
     def connectedToGpio(self):
         return self.gpio is not None and self.gpio.connected
 
+    @property
+    def meanReadLatencyS(self):
+        """Mean time from start signal to end of transmission over recent reads."""
+        if not self.readLatenciesS:
+            return None
+        return sum(self.readLatenciesS) / len(self.readLatenciesS)
+
 
 if __name__ == "__main__":
-    with AM2302Reader() as am2302:
+    with AM2302Reader(maxRetries=2) as am2302:
         for count in range(10):
             try:
                 print("Is connected? {}".format(am2302.connectedToGpio))
                 am2302.readSensor()
                 print(
-                    "T: {}F, RH: {}%".format(
-                        round(am2302.temperatureF, 2), round(am2302.relativeHumidity, 1)
+                    "T: {}F, RH: {}% ({:.1f} ms)".format(
+                        round(am2302.temperatureF, 2),
+                        round(am2302.relativeHumidity, 1),
+                        am2302.lastReadLatencyS * 1e3,
                     )
                 )
-            except (AM2302InsufficientDataRecieved, AM2302ChecksumFailed) as e:
+            except (
+                AM2302NoData,
+                AM2302InsufficientDataRecieved,
+                AM2302ChecksumFailed,
+            ) as e:
                 print("Caught {} - Faulty transmission, skipping".format(str(e)))
             except Exception:
                 am2302.cleanUpGpio()
                 raise
+        print(am2302.stats)
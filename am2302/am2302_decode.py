@@ -0,0 +1,230 @@
+import numpy as np
+
+N_FRAME_EDGES = 42  # sensor start pulse plus 40 data bits, bounded by falling edges
+N_PAYLOAD_BITS = 40
+N_PAYLOAD_BYTES = N_PAYLOAD_BITS // 8
+# each pulse has a 50us low, followed by high of ~25us for 0, 75us for 1
+ONE_BIT_THRESHOLD_US = 100
+# the sensor's start pulse is ~160us, longer than any single data bit
+START_PULSE_THRESHOLD_US = 140
+# two bit periods merged by a missed edge last at least ~152us
+MERGED_BITS_THRESHOLD_US = 136
+# the start pulse merged with a first 0 bit lasts ~236us, with a 1 ~280us
+MERGED_START_THRESHOLD_US = 200
+MERGED_START_ONE_THRESHOLD_US = 258
+AM2302_SCALE_FACTOR = 1.0 / 10.0
+TICK_WRAP_MASK = 0xFFFFFFFF  # pigpio ticks are 32 bit microseconds
+BIT_WEIGHTS = np.array([128, 64, 32, 16, 8, 4, 2, 1], dtype=np.int64)
+
+
+class AM2302InsufficientDataRecieved(Exception):
+    """Raised when too few edges are detected when reading AM2302."""
+
+    pass
+
+
+class AM2302ChecksumFailed(Exception):
+    """Raised when checksum does not match payload from AM2302."""
+
+    pass
+
+
+class AM2302NoData(Exception):
+    """No falling edges are available, likely because sensor hasn't been read."""
+
+    pass
+
+
+def validateEdgeCount(nEdges):
+    """Check a capture has the 42 edges of a frame, or 41 with one missed.
+
+    Raises:
+        AM2302NoData: if no edges were captured
+        AM2302InsufficientDataRecieved: if there are too few or too many edges
+    """
+    if nEdges == 0:
+        raise AM2302NoData("Didn't get any data from sensor.")
+    elif nEdges < N_FRAME_EDGES - 1:
+        raise AM2302InsufficientDataRecieved(
+            "Only received {} of 40 bits from sensor, try again.".format(nEdges - 2)
+        )
+    elif nEdges == N_FRAME_EDGES - 1:
+        print("Warning: missed one edge - usually is the first; verify checksum")
+    elif nEdges > N_FRAME_EDGES:
+        raise AM2302InsufficientDataRecieved(
+            "Received {} of expected 40 bits from sensor, try again.".format(nEdges - 2)
+        )
+
+
+def isChecksumValid(payload):
+    return (sum(payload[:4]) & 0xFF) == payload[4]
+
+
+def verifyPayloadChecksum(payload):
+    """
+    Raises:
+        AM2302ChecksumFailed: if the 5th byte is not the sum of the first four
+    """
+    if not isChecksumValid(payload):
+        raise AM2302ChecksumFailed(
+            "Failed checksum verification {} != {}".format(
+                bin(sum(payload[:4]) & 0xFF), bin(payload[4])
+            )
+        )
+
+
+def packEdgeTickFrames(frames):
+    """Pack variable length lists of falling edge ticks into a padded 2-D array.
+
+    Args:
+        frames (list): one sequence of edge ticks in microseconds per capture
+
+    Returns:
+        (np.ndarray, np.ndarray): (nFrames, 42) int64 ticks, left aligned and
+            zero padded, and the number of edges in each frame
+    """
+    edgeCounts = np.fromiter((len(frame) for frame in frames), np.int64, len(frames))
+    edgeTicksUs = np.zeros((len(frames), N_FRAME_EDGES), dtype=np.int64)
+    for row, frame in enumerate(frames):
+        n = min(len(frame), N_FRAME_EDGES)
+        edgeTicksUs[row, :n] = frame[:n]
+    return edgeTicksUs, edgeCounts
+
+
+def decodeEdgeTicksToBytes(edgeTicksUs, edgeCounts=None):
+    """Decode many captured frames of falling edge ticks into payload bytes.
+
+    A complete frame has 42 edges: the sensor's start pulse followed by 40
+    data bits. The first edge is sometimes missed, leaving 41 edges whose 40
+    intervals are all data bits. Any other edge count cannot be decoded.
+
+    Args:
+        edgeTicksUs (np.ndarray): (nFrames, 42) edge ticks in microseconds,
+            left aligned; for 41-edge frames the last column is ignored
+        edgeCounts (np.ndarray): (nFrames,) edges captured per frame; all
+            frames are taken to be complete if None
+
+    Returns:
+        (np.ndarray, np.ndarray): (nFrames, 5) payload bytes and a boolean mask
+            of frames with a decodable number of edges
+    """
+    edgeTicksUs = np.atleast_2d(np.asarray(edgeTicksUs, dtype=np.int64))
+    nFrames = edgeTicksUs.shape[0]
+    if edgeCounts is None:
+        edgeCounts = np.full(nFrames, edgeTicksUs.shape[1], dtype=np.int64)
+    edgeCounts = np.asarray(edgeCounts)
+    frameValid = (edgeCounts == N_FRAME_EDGES) | (edgeCounts == N_FRAME_EDGES - 1)
+    if edgeTicksUs.shape[1] < N_FRAME_EDGES:
+        nMissing = N_FRAME_EDGES - edgeTicksUs.shape[1]
+        edgeTicksUs = np.pad(edgeTicksUs, ((0, 0), (0, nMissing)))
+
+    pulseDurationsUs = np.diff(edgeTicksUs[:, :N_FRAME_EDGES], axis=1) & TICK_WRAP_MASK
+    # skip the start pulse in complete frames; 41-edge frames lost it already
+    firstBit = (edgeCounts == N_FRAME_EDGES).astype(np.int64)
+    bitColumns = firstBit[:, None] + np.arange(N_PAYLOAD_BITS)
+    bitDurationsUs = np.take_along_axis(pulseDurationsUs, bitColumns, axis=1)
+    bits = bitDurationsUs > ONE_BIT_THRESHOLD_US
+    payload = bits.reshape(nFrames, N_PAYLOAD_BYTES, 8) @ BIT_WEIGHTS
+    return payload.astype(np.uint8), frameValid
+
+
+def decodePayloadBytes(payload):
+    """Convert (nFrames, 5) payload bytes into physical readings.
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): relative humidity in %,
+            temperature in F and a boolean mask of frames passing the checksum
+    """
+    payload = np.atleast_2d(payload).astype(np.int64)
+    relativeHumidity = ((payload[:, 0] << 8) + payload[:, 1]) * AM2302_SCALE_FACTOR
+    temperatureC = (((payload[:, 2] & 0x7F) << 8) + payload[:, 3]) * AM2302_SCALE_FACTOR
+    temperatureC = np.where(payload[:, 2] & 0x80, -temperatureC, temperatureC)
+    temperatureF = temperatureC * 9.0 / 5.0 + 32.0
+    checksumValid = (payload[:, :4].sum(axis=1) & 0xFF) == payload[:, 4]
+    return relativeHumidity, temperatureF, checksumValid
+
+
+def decodeEdgeTickFrames(edgeTicksUs, edgeCounts=None):
+    """Decode many captured frames into readings in one vectorized pass.
+
+    Args:
+        edgeTicksUs (np.ndarray): (nFrames, 42) edge ticks, see
+            decodeEdgeTicksToBytes
+        edgeCounts (np.ndarray): (nFrames,) edges captured per frame
+
+    Returns:
+        (np.ndarray, np.ndarray, np.ndarray): relative humidity in %,
+            temperature in F and a boolean mask of frames that had a decodable
+            edge count and passed the checksum; readings of frames failing
+            either check are NaN
+    """
+    payload, frameValid = decodeEdgeTicksToBytes(edgeTicksUs, edgeCounts)
+    relativeHumidity, temperatureF, checksumValid = decodePayloadBytes(payload)
+    valid = frameValid & checksumValid
+    relativeHumidity = np.where(valid, relativeHumidity, np.nan)
+    temperatureF = np.where(valid, temperatureF, np.nan)
+    return relativeHumidity, temperatureF, valid
+
+
+def bitsToBytes(bits):
+    return [
+        sum(bit << (7 - i) for i, bit in enumerate(bits[start : start + 8]))
+        for start in range(0, N_PAYLOAD_BITS, 8)
+    ]
+
+
+def shortFramePayloadCandidates(edgeTicksUs):
+    """List the payloads a 41-edge frame could have carried.
+
+    With one edge missing there are three ways to read the frame, told apart
+    by the interval lengths: the start pulse's leading edge was missed (the
+    usual case, and what decodeEdgeTicksToBytes assumes), the final edge was
+    missed so the first interval is the long start pulse and the last bit is
+    unknown, or an edge inside the frame was missed so two periods merged into
+    one interval longer than either alone.
+
+    Args:
+        edgeTicksUs (list): the 41 falling edge ticks of one capture
+
+    Returns:
+        list: 5-byte payload candidates consistent with the interval lengths;
+            only the checksum can pick between several
+    """
+    if len(edgeTicksUs) != N_FRAME_EDGES - 1:
+        return []
+    pulseDurationsUs = [
+        (t - s) & TICK_WRAP_MASK for s, t in zip(edgeTicksUs, edgeTicksUs[1:])
+    ]
+    bits = [int(tDeltaUs > ONE_BIT_THRESHOLD_US) for tDeltaUs in pulseDurationsUs]
+
+    mergedIndex = max(range(1, len(pulseDurationsUs)), key=pulseDurationsUs.__getitem__)
+    mergedUs = pulseDurationsUs[mergedIndex]
+    if mergedUs > MERGED_BITS_THRESHOLD_US:
+        # an inner edge missed: the interval's length says how many ones it held
+        if mergedUs < 1.75 * ONE_BIT_THRESHOLD_US:
+            pairs = [(0, 0)]
+        elif mergedUs < 2.2 * ONE_BIT_THRESHOLD_US:
+            pairs = [(0, 1), (1, 0)]
+        else:
+            pairs = [(1, 1)]
+        if pulseDurationsUs[0] > START_PULSE_THRESHOLD_US:
+            dataBits, splitAt = bits[1:], mergedIndex - 1
+        else:
+            dataBits, splitAt = bits, mergedIndex
+        candidateBits = [
+            dataBits[:splitAt] + list(pair) + dataBits[splitAt + 1 :] for pair in pairs
+        ]
+    elif pulseDurationsUs[0] > MERGED_START_THRESHOLD_US:
+        # the edge between the start pulse and the first bit was missed
+        firstBit = int(pulseDurationsUs[0] > MERGED_START_ONE_THRESHOLD_US)
+        candidateBits = [[firstBit] + bits[1:]]
+    elif pulseDurationsUs[0] > START_PULSE_THRESHOLD_US:
+        # the start pulse is present, so the final edge must have been missed
+        candidateBits = [bits[1:] + [lastBit] for lastBit in (0, 1)]
+    else:
+        candidateBits = [bits]
+    return [
+        bitsToBytes(bitList)
+        for bitList in candidateBits
+        if len(bitList) == N_PAYLOAD_BITS
+    ]
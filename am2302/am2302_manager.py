@@ -0,0 +1,194 @@
+import heapq
+import pigpio
+import threading
+import time
+
+from am2302 import (
+    MIN_TIME_BETWEEN_READS_S,
+    AM2302Reader,
+    AM2302Reading,
+    PiConnectionError,
+)
+
+# a sensor is reported unhealthy after this many failed reads in a row
+MAX_CONSECUTIVE_FAILURES = 5
+
+
+class AM2302SensorHealth:
+    """Liveness of one sensor: how long since it last gave a good reading.
+
+    Outcome counters and rates are kept by the sensor's reader, in
+    AM2302Reader.stats; AM2302Manager.stats collects them for every pin.
+    """
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.consecutiveFailures = 0
+        self.lastSuccessS = None
+        self.lastError = None
+
+    def recordSuccess(self, timestampS):
+        self.consecutiveFailures = 0
+        self.lastSuccessS = timestampS
+
+    def recordFailure(self, error):
+        self.consecutiveFailures += 1
+        self.lastError = error
+
+    @property
+    def healthy(self):
+        return self.consecutiveFailures < MAX_CONSECUTIVE_FAILURES
+
+    def __repr__(self):
+        return (
+            "AM2302SensorHealth(pin={}, consecutiveFailures={}, lastError={!r}, "
+            "healthy={})".format(
+                self.pin, self.consecutiveFailures, self.lastError, self.healthy
+            )
+        )
+
+
+class AM2302Manager:
+    """Drive several AM2302 sensors over a single pigpio daemon connection.
+
+    Each sensor is read once per period, with start pulses staggered evenly
+    across the period so transmissions never overlap. Every sensor still gets
+    at least MIN_TIME_BETWEEN_READS_S between its own reads, so total
+    throughput is len(pins) readings per period.
+    """
+
+    def __init__(self, pins, periodS=MIN_TIME_BETWEEN_READS_S, store=None):
+        """
+        Args:
+            pins (list): BCM GPIO numbers, one per sensor
+            periodS (float): time between reads of any one sensor, never less
+                than MIN_TIME_BETWEEN_READS_S
+            store (ReadingStore): if given, every good reading is appended to
+                it under its pin number
+        """
+        if len(set(pins)) != len(pins):
+            raise ValueError("Each sensor must be on its own pin: {}".format(pins))
+        self.pins = list(pins)
+        self.periodS = max(periodS, MIN_TIME_BETWEEN_READS_S)
+        self.store = store
+        self.gpio = None
+        self.readers = {}
+        self.health = {pin: AM2302SensorHealth(pin) for pin in self.pins}
+        self.schedulerThread = None
+        self.stopEvent = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanUpGpio()
+
+    def connectToPigpio(self, gpio=None):
+        """
+        Open the shared pigpio connection and create a reader per pin.
+
+        Args:
+            gpio (pigpio.pi): an existing connection to use instead of opening one
+
+        Raises:
+            PiConnectionError: If a connection to pigpio cannot be established.
+        """
+        self.gpio = gpio if gpio is not None else pigpio.pi()
+        if not self.gpio.connected:
+            raise PiConnectionError("Failed to connect to pigpio")
+        self.readers = {pin: AM2302Reader(pin, gpio=self.gpio) for pin in self.pins}
+
+    def cleanUpGpio(self):
+        """Stop sampling, release every pin and close the shared connection."""
+        self.stop()
+        for reader in self.readers.values():
+            reader.cleanUpGpio()
+        if self.gpio is not None and self.gpio.connected:
+            self.gpio.stop()
+
+    def start(self):
+        """Start reading all sensors on a background scheduling thread."""
+        if self.gpio is None:
+            self.connectToPigpio()
+        if self.schedulerThread is not None and self.schedulerThread.is_alive():
+            return
+        self.stopEvent.clear()
+        self.schedulerThread = threading.Thread(
+            target=self.runSchedule, name="AM2302Manager", daemon=True
+        )
+        self.schedulerThread.start()
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.schedulerThread is not None:
+            self.schedulerThread.join()
+        self.schedulerThread = None
+
+    def runSchedule(self):
+        staggerS = self.periodS / len(self.pins)
+        nowS = time.clock_gettime(time.CLOCK_MONOTONIC)
+        schedule = [(nowS + i * staggerS, pin) for i, pin in enumerate(self.pins)]
+        heapq.heapify(schedule)
+        while not self.stopEvent.is_set():
+            dueS, pin = heapq.heappop(schedule)
+            if self.stopEvent.wait(dueS - time.clock_gettime(time.CLOCK_MONOTONIC)):
+                break
+            self.readOnce(pin)
+            heapq.heappush(schedule, (dueS + self.periodS, pin))
+
+    def readOnce(self, pin):
+        """Read one sensor, updating its health and cached reading."""
+        reader = self.readers[pin]
+        try:
+            reader.readSensor()
+        except Exception as e:
+            self.health[pin].recordFailure(e)
+            return None
+        reading = AM2302Reading(
+            reader.temperatureF, reader.relativeHumidity, reader.lastRequestTimeS
+        )
+        self.health[pin].recordSuccess(reading.timestampS)
+        reader.publishReading(reading)
+        if self.store is not None:
+            self.store.append(pin, reading.temperatureF, reading.relativeHumidity)
+        return reading
+
+    def getLatestReading(self, pin, maxAgeS=None):
+        return self.readers[pin].getLatestReading(maxAgeS)
+
+    def getLatestReadings(self, maxAgeS=None):
+        return {
+            pin: reader.getLatestReading(maxAgeS)
+            for pin, reader in self.readers.items()
+        }
+
+    @property
+    def stats(self):
+        """Each sensor's AM2302ReadStats, by pin."""
+        return {pin: reader.stats for pin, reader in self.readers.items()}
+
+    @property
+    def unhealthyPins(self):
+        return [pin for pin, health in self.health.items() if not health.healthy]
+
+
+if __name__ == "__main__":
+    with AM2302Manager([19, 20, 21]) as manager:
+        manager.start()
+        for count in range(10):
+            time.sleep(MIN_TIME_BETWEEN_READS_S)
+            for pin, reading in manager.getLatestReadings().items():
+                if reading is None:
+                    print("pin {}: no reading yet".format(pin))
+                else:
+                    print(
+                        "pin {}: T: {}F, RH: {}% ({:.1f} s old)".format(
+                            pin,
+                            round(reading.temperatureF, 2),
+                            round(reading.relativeHumidity, 1),
+                            reading.ageS,
+                        )
+                    )
+        for pin, health in manager.health.items():
+            print(health)
+            print(manager.stats[pin])
@@ -0,0 +1,145 @@
+import os
+import select
+import struct
+import time
+
+NOTIFICATION_FORMAT = "HHII"  # seqno, flags, tick, level
+NOTIFICATION_SIZE = struct.calcsize(NOTIFICATION_FORMAT)
+# one AM2302 frame is 42 falling and 42 rising edges; leave room for stragglers
+READ_SIZE = NOTIFICATION_SIZE * 256
+# by the time this much has passed since the start signal a full frame is buffered
+FRAME_DURATION_S = 160e-6 + 41.0 * 130e-6
+TICK_MASK = 0xFFFFFFFF
+
+
+class AM2302NotificationCapture:
+    """Capture AM2302 edges in bulk from a pigpio notification pipe.
+
+    The pigpio daemon timestamps every level change of the pin and writes it
+    to /dev/pigpio<handle>. Nothing runs in Python per edge: the whole frame
+    is read from the pipe in one go once the transmission is over and the
+    falling edges are decoded from the raw reports afterwards. Pipes are only
+    available when running on the Pi itself.
+    """
+
+    def __init__(self, gpio, pin):
+        """
+        Args:
+            gpio (pigpio.pi): connected pigpio object
+            pin (int): BCM GPIO number the sensor's data line is attached to
+        """
+        self.gpio = gpio
+        self.pin = pin
+        self.handle = None
+        self.pipeFd = None
+        self.lastReports = b""
+
+    def open(self):
+        self.handle = self.gpio.notify_open()
+        if self.handle < 0:
+            raise OSError("pigpio could not open a notification handle")
+        self.pipeFd = os.open(
+            "/dev/pigpio{}".format(self.handle), os.O_RDONLY | os.O_NONBLOCK
+        )
+
+    def close(self):
+        if self.pipeFd is not None:
+            os.close(self.pipeFd)
+            self.pipeFd = None
+        if self.handle is not None:
+            if self.gpio.connected:
+                self.gpio.notify_close(self.handle)
+            self.handle = None
+
+    def begin(self):
+        """Discard stale reports and start recording the pin's level changes.
+
+        Call this before sending the start signal, so the sensor's first edge
+        can't arrive before recording starts.
+        """
+        self.drain()
+        self.gpio.notify_begin(self.handle, 1 << self.pin)
+
+    def collectFallingEdges(
+        self, nEdges, requestTimeS, timeoutS, idleTimeoutS, releaseTickUs=None
+    ):
+        """Read the pipe in bulk until nEdges falling edges or the line goes quiet.
+
+        Args:
+            nEdges (int): number of falling edges that completes a frame
+            requestTimeS (float): CLOCK_MONOTONIC time the start signal ended
+            timeoutS (float): deadline, measured from now, for the transmission
+            idleTimeoutS (float): stop once no report arrives for this long
+            releaseTickUs (int): pigpio tick taken while the host still held the
+                line low; falling edges before it are the host's own start
+                signal and are dropped
+
+        Returns:
+            list: falling edge ticks in microseconds
+        """
+        deadlineS = time.clock_gettime(time.CLOCK_MONOTONIC) + timeoutS
+        # let the sensor send the whole frame before touching the pipe
+        waitS = (
+            requestTimeS + FRAME_DURATION_S - time.clock_gettime(time.CLOCK_MONOTONIC)
+        )
+        if waitS > 0.0:
+            time.sleep(waitS)
+
+        reports = bytearray()
+        fallingEdgeTimesUs = []
+        while len(fallingEdgeTimesUs) < nEdges:
+            remainingS = deadlineS - time.clock_gettime(time.CLOCK_MONOTONIC)
+            if remainingS <= 0.0:
+                break
+            readable, _, _ = select.select(
+                [self.pipeFd], [], [], min(remainingS, idleTimeoutS)
+            )
+            if not readable:
+                break
+            chunk = self.readAvailable()
+            if not chunk:
+                break
+            reports += chunk
+            fallingEdgeTimesUs = self.decodeFallingEdges(reports, releaseTickUs)
+
+        self.gpio.notify_pause(self.handle)
+        self.lastReports = bytes(reports)
+        return fallingEdgeTimesUs
+
+    def readAvailable(self):
+        try:
+            return os.read(self.pipeFd, READ_SIZE)
+        except BlockingIOError:
+            return b""
+
+    def drain(self):
+        while self.readAvailable():
+            pass
+
+    def decodeFallingEdges(self, reports, releaseTickUs=None):
+        """Extract falling edge ticks for our pin from raw notification reports.
+
+        The line idles high under its pull up, so the level before the first
+        report is taken to be high. Partial trailing reports are ignored, as
+        are falling edges before releaseTickUs, if given.
+        """
+        bit = 1 << self.pin
+        wasHigh = True
+        fallingEdgeTimesUs = []
+        usable = len(reports) - len(reports) % NOTIFICATION_SIZE
+        for _, flags, tick, level in struct.iter_unpack(
+            NOTIFICATION_FORMAT, memoryview(reports)[:usable]
+        ):
+            if flags:
+                # watchdog, keep alive or event report - not a level change
+                continue
+            isHigh = bool(level & bit)
+            # ticks wrap every ~72 minutes, so compare them modulo 2**32
+            hostEdge = (
+                releaseTickUs is not None
+                and (tick - releaseTickUs) & TICK_MASK > TICK_MASK // 2
+            )
+            if wasHigh and not isHigh and not hostEdge:
+                fallingEdgeTimesUs.append(tick)
+            wasHigh = isHigh
+        return fallingEdgeTimesUs
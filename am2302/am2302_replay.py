@@ -0,0 +1,323 @@
+"""Record AM2302 edge captures and replay them through a stand-in for pigpio.pi.
+
+Lets AM2302Reader be benchmarked and regression tested off-device, either
+from captures recorded on a real sensor or from synthetic frames with
+configurable jitter, dropped edges and bit flips.
+"""
+
+import argparse
+import collections
+import pigpio
+import random
+import struct
+import threading
+import time
+
+from am2302_decode import decodeEdgeTickFrames, packEdgeTickFrames
+
+# capture file: header, then per read a record header followed by its ticks
+CAPTURE_MAGIC = b"AM2302EC"
+CAPTURE_VERSION = 1
+FILE_HEADER = struct.Struct("<8sH")  # magic, version
+RECORD_HEADER = struct.Struct("<dB")  # wall clock time of the read, edge count
+TICK_FORMAT = "<{}I"  # pigpio ticks, microseconds
+TICK_WRAP_MASK = 0xFFFFFFFF
+
+# nominal timing of a transmission, measured between falling edges
+START_PULSE_US = 160.0  # 80us low, 80us high
+ZERO_BIT_US = 76.0  # 50us low, 26us high
+ONE_BIT_US = 120.0  # 50us low, 70us high
+RESPONSE_DELAY_US = 30.0  # sensor pulls the line low 20-40us after release
+
+
+class CaptureWriter:
+    """Append edge captures to a compact binary capture file."""
+
+    def __init__(self, path):
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, timestampS, edgeTicksUs):
+        edgeTicksUs = edgeTicksUs[:255]
+        self.file.write(RECORD_HEADER.pack(timestampS, len(edgeTicksUs)))
+        self.file.write(
+            struct.pack(
+                TICK_FORMAT.format(len(edgeTicksUs)),
+                *(tick & TICK_WRAP_MASK for tick in edgeTicksUs),
+            )
+        )
+
+    def close(self):
+        self.file.close()
+
+
+def readCaptures(path):
+    """Yield (timestampS, edgeTicksUs) for every read stored in a capture file."""
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version = FILE_HEADER.unpack_from(data)
+    if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+        raise ValueError("{} is not a version {} AM2302 capture".format(path, version))
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= len(data):
+        timestampS, nEdges = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        tickFormat = TICK_FORMAT.format(nEdges)
+        yield timestampS, list(struct.unpack_from(tickFormat, data, offset))
+        offset += struct.calcsize(tickFormat)
+
+
+def recordCaptures(reader, path, nReads):
+    """Read a real sensor nReads times, storing every raw capture, good or bad."""
+    with CaptureWriter(path) as writer:
+        for count in range(nReads):
+            try:
+                reader.readSensor()
+            except Exception as e:
+                print("Read {} failed: {}".format(count, e))
+            writer.write(time.time(), reader.fallingEdgeTimesUs)
+
+
+def synthesizeEdgeTicks(
+    relativeHumidity,
+    temperatureC,
+    jitterUs=0.0,
+    firstEdgeDropProbability=0.0,
+    edgeDropProbability=0.0,
+    bitFlipProbability=0.0,
+    rng=random,
+):
+    """Generate the falling edge ticks the sensor would send for a reading.
+
+    Args:
+        relativeHumidity (float): humidity to encode, in %
+        temperatureC (float): temperature to encode, in C
+        jitterUs (float): standard deviation of gaussian noise on each pulse
+        firstEdgeDropProbability (float): chance the start pulse's leading
+            edge is missed, as commonly happens on real hardware
+        edgeDropProbability (float): chance any other edge is missed
+        bitFlipProbability (float): chance each transmitted bit is inverted
+        rng (random.Random): source of randomness
+
+    Returns:
+        list: falling edge ticks in microseconds, starting at 0
+    """
+    rawHumidity = round(relativeHumidity * 10.0)
+    rawTemperature = round(abs(temperatureC) * 10.0)
+    if temperatureC < 0:
+        rawTemperature |= 0x8000
+    payload = [
+        rawHumidity >> 8,
+        rawHumidity & 0xFF,
+        rawTemperature >> 8,
+        rawTemperature & 0xFF,
+    ]
+    payload.append(sum(payload) & 0xFF)
+    bits = [(byte >> shift) & 1 for byte in payload for shift in range(7, -1, -1)]
+    bits = [bit ^ (rng.random() < bitFlipProbability) for bit in bits]
+
+    pulsesUs = [START_PULSE_US] + [ONE_BIT_US if bit else ZERO_BIT_US for bit in bits]
+    edgeTicksUs = [0]
+    for pulseUs in pulsesUs:
+        edgeTicksUs.append(edgeTicksUs[-1] + max(pulseUs + rng.gauss(0.0, jitterUs), 1))
+    edgeTicksUs = [round(tick) for tick in edgeTicksUs]
+
+    if rng.random() < firstEdgeDropProbability:
+        edgeTicksUs.pop(0)
+    return [tick for tick in edgeTicksUs if rng.random() >= edgeDropProbability]
+
+
+def syntheticFrames(
+    nFrames=None, relativeHumidity=45.0, temperatureC=21.5, seed=None, **faults
+):
+    """Yield synthetic captures, forever if nFrames is None.
+
+    Readings wander slightly around the given values. Keyword arguments are
+    passed on to synthesizeEdgeTicks to inject faults.
+    """
+    rng = random.Random(seed)
+    count = 0
+    while nFrames is None or count < nFrames:
+        yield synthesizeEdgeTicks(
+            relativeHumidity + rng.uniform(-1.0, 1.0),
+            temperatureC + rng.uniform(-0.5, 0.5),
+            rng=rng,
+            **faults,
+        )
+        count += 1
+
+
+class ReplayCallback:
+    def __init__(self, replayPi, pin, edge, func):
+        self.replayPi = replayPi
+        self.gpio = pin
+        self.edge = edge
+        self.func = func
+
+    def cancel(self):
+        self.replayPi.removeCallback(self)
+
+
+class ReplayPi:
+    """Stand-in for pigpio.pi that answers AM2302 start signals with captures.
+
+    When a pin driven low as an output is switched back to an input, as
+    AM2302Reader does at the end of its start signal, the next capture is
+    played back to that pin's callbacks from a background thread with its
+    recorded inter-edge timing. Edges that fire before a callback is
+    registered are lost, as on real hardware. Only callback capture is
+    supported; there is no notification pipe.
+    """
+
+    def __init__(self, frames, responseDelayUs=RESPONSE_DELAY_US):
+        """
+        Args:
+            frames (iterable): edge tick lists to play back, one per request;
+                once exhausted the simulated sensor stops answering
+            responseDelayUs (float): delay from release of the line to the
+                first edge
+        """
+        self.frames = iter(frames)
+        self.responseDelayUs = responseDelayUs
+        self.connected = True
+        self.modes = {}
+        self.callbacks = []
+        self.callbacksLock = threading.Lock()
+        self.pendingStartSignals = set()
+        self.replayThread = None
+        self.framesReplayed = 0
+
+    def get_current_tick(self):
+        return int(time.clock_gettime(time.CLOCK_MONOTONIC) * 1e6) & TICK_WRAP_MASK
+
+    def set_mode(self, pin, mode):
+        self.modes[pin] = mode
+        if mode == pigpio.INPUT and pin in self.pendingStartSignals:
+            self.pendingStartSignals.discard(pin)
+            self.replayNextFrame(pin)
+
+    def set_pull_up_down(self, pin, pud):
+        pass
+
+    def write(self, pin, level):
+        if self.modes.get(pin) == pigpio.OUTPUT and level == 0:
+            self.pendingStartSignals.add(pin)
+
+    def callback(self, pin, edge=pigpio.RISING_EDGE, func=None):
+        cb = ReplayCallback(self, pin, edge, func)
+        with self.callbacksLock:
+            self.callbacks.append(cb)
+        return cb
+
+    def removeCallback(self, cb):
+        with self.callbacksLock:
+            if cb in self.callbacks:
+                self.callbacks.remove(cb)
+
+    def stop(self):
+        self.connected = False
+        if self.replayThread is not None:
+            self.replayThread.join()
+
+    def replayNextFrame(self, pin):
+        frame = next(self.frames, None)
+        if not frame:
+            return
+        if self.replayThread is not None:
+            self.replayThread.join()
+        self.replayThread = threading.Thread(
+            target=self.playFrame, args=(pin, frame), daemon=True
+        )
+        self.replayThread.start()
+        self.framesReplayed += 1
+
+    def playFrame(self, pin, frame):
+        releaseS = time.clock_gettime(time.CLOCK_MONOTONIC)
+        baseTickUs = self.get_current_tick()
+        for tickUs in frame:
+            offsetUs = (tickUs - frame[0]) + self.responseDelayUs
+            waitS = (
+                releaseS + offsetUs * 1e-6 - time.clock_gettime(time.CLOCK_MONOTONIC)
+            )
+            if waitS > 0.0:
+                time.sleep(waitS)
+            with self.callbacksLock:
+                callbacks = [cb for cb in self.callbacks if cb.gpio == pin]
+            for cb in callbacks:
+                cb.func(pin, 0, int(baseTickUs + offsetUs) & TICK_WRAP_MASK)
+
+
+def benchmarkReplay(frames, nReads, minTimeBetweenReadsS, maxRetries=0):
+    # imported here so capture files can be handled without the reader
+    from am2302 import AM2302Reader
+
+    reader = AM2302Reader(gpio=ReplayPi(frames), maxRetries=maxRetries)
+    reader.minTimeBetweenReadsS = minTimeBetweenReadsS
+    failures = collections.Counter()
+    captures = []
+    for count in range(nReads):
+        try:
+            reader.readSensor()
+        except Exception as e:
+            failures[type(e).__name__] += 1
+        captures.append(list(reader.fallingEdgeTimesUs))
+    reader.cleanUpGpio()
+
+    latenciesMs = sorted(latencyS * 1e3 for latencyS in reader.readLatenciesS)
+    print("reads: {}, failures: {}".format(nReads, dict(failures)))
+    print("edges per read: {}".format(dict(sorted(reader.stats.edgeCounts.items()))))
+    print(reader.stats)
+    if latenciesMs:
+        print(
+            "latency of last {} reads: median {:.2f} ms, max {:.2f} ms".format(
+                len(latenciesMs), latenciesMs[len(latenciesMs) // 2], latenciesMs[-1]
+            )
+        )
+
+    edgeTicksUs, edgeCounts = packEdgeTickFrames(captures)
+    startS = time.perf_counter()
+    _, _, valid = decodeEdgeTickFrames(edgeTicksUs, edgeCounts)
+    elapsedS = time.perf_counter() - startS
+    print(
+        "batch decode: {:.0f} frames/s, {} of {} valid".format(
+            len(captures) / elapsedS, valid.sum(), len(captures)
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--captures", help="capture file to replay")
+    parser.add_argument("--record", help="record real sensor captures to this file")
+    parser.add_argument("--reads", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds")
+    parser.add_argument("--retries", type=int, default=0)
+    parser.add_argument("--jitter", type=float, default=5.0, help="microseconds")
+    parser.add_argument("--drop-first", type=float, default=0.2)
+    parser.add_argument("--drop", type=float, default=0.002)
+    parser.add_argument("--flip", type=float, default=0.001)
+    args = parser.parse_args()
+
+    if args.record:
+        from am2302 import AM2302Reader
+
+        with AM2302Reader() as reader:
+            recordCaptures(reader, args.record, args.reads)
+    else:
+        if args.captures:
+            frames = [ticks for _, ticks in readCaptures(args.captures)]
+        else:
+            frames = syntheticFrames(
+                jitterUs=args.jitter,
+                firstEdgeDropProbability=args.drop_first,
+                edgeDropProbability=args.drop,
+                bitFlipProbability=args.flip,
+            )
+        benchmarkReplay(frames, args.reads, args.interval, args.retries)
@@ -1,10 +1,27 @@
 import RPi.GPIO as GPIO
+import numpy as np
 import time
+from am2302_decode import (
+    decodeEdgeTicksToBytes,
+    decodePayloadBytes,
+    validateEdgeCount,
+    verifyPayloadChecksum,
+)
 
-sensorPin = 19 
+sensorPin = 19
 sendStartTimeMs = 5.
 initTimeMs = 15.
 MS_TO_S = 1. / 1000.
+# the sensor answers within 40 us and a full frame lasts ~5 ms
+CAPTURE_WINDOW_S = 6.0 * MS_TO_S
+# far more samples than a Pi can take in the window, so the buffer never fills
+MAX_SAMPLES = 50000
+NS_TO_US = 1. / 1000.
+
+# preallocate the sample buffers so nothing is allocated while sampling
+levels = np.zeros(MAX_SAMPLES, dtype=np.uint8)
+sampleTimesNs = np.zeros(MAX_SAMPLES, dtype=np.int64)
+
 GPIO.setmode(GPIO.BCM)
 
 # set up as output in high state
@@ -17,68 +34,45 @@ pinState = GPIO.LOW
 GPIO.output(sensorPin, pinState)
 time.sleep(sendStartTimeMs * MS_TO_S)
 
-transitionBuffer = []
-def respondToTransition(channel):
-    #global transitionBuffer
-    thisTime = time.time()
-    print("something on channel {}".format(channel))
-    #if GPIO.input(sensorPin) == GPIO.LOW:
-    #    print("low!")
-    #else:
-    #    print("high!")
-    #transitionBuffer.append(thisTime)
-
-def bitArrayToInt(bits):
-    val = 0
-    for bit in bits:
-        val <<= 1
-        val |= bit
-    return val
-
-def decodeTDeltasUs(tDeltasUs):
-
-    # each pulse has a 50 us low, followed by high of 25 us for 0, 50 us for 1
-    bits = [tDeltaUs > 100 for tDeltaUs in tDeltasUs]
-
-    # the first pulse is the start signal from sensor, ignore
-    bits.pop(0)
-
-    RH_INDEX_RANGE = [0, 16]
-    TEMP_INDEX_RANGE = [17, 32]
-    TEMP_SIGN_BIT = 16
-    AM2302_SCALE_FACTOR = 1. / 10.
-    relativeHumidity = bitArrayToInt(bits[RH_INDEX_RANGE[0]:RH_INDEX_RANGE[1]]) * AM2302_SCALE_FACTOR
-    temperatureF = bitArrayToInt(bits[TEMP_INDEX_RANGE[0]:TEMP_INDEX_RANGE[1]]) * AM2302_SCALE_FACTOR * 9. / 5. + 32.
-    if bits[TEMP_SIGN_BIT]:
-        temperatureF = -temperatureF
-    return temperatureF, relativeHumidity
+# Edge detection via GPIO.wait_for_edge or GPIO.add_event_detect callbacks
+# fails to catch the edges, and watching for changes in a python loop for
+# seconds ties up a core. Instead, sample the pin as fast as possible for just
+# the transmission window and find the edges afterwards.
 
 # configure as an input with pull up resistor; after 20-40 us sensor will pull low
 GPIO.setup(sensorPin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-pinState = GPIO.input(sensorPin)
-tStart = time.time()
+readPin = GPIO.input
+clock = time.perf_counter_ns
+deadlineNs = clock() + int(CAPTURE_WINDOW_S * 1e9)
+nSamples = 0
 try:
-    # # fails to catch the edges
-    # while time.time() - tStart < 2.:
-    #     channel = GPIO.wait_for_edge(sensorPin, GPIO.FALLING, timeout=2000)
-    #     respondToTransition(channel)
-    
-    # # fails to catch the edges
-    # GPIO.add_event_detect(sensorPin, GPIO.FALLING, callback=respondToTransition)
-    # while True:
-    #     pass
-
-    # works but this is blocking
-    while time.time() - tStart < 2.:
-        if GPIO.input(sensorPin) != pinState:
-            pinState = not pinState
-            if pinState == GPIO.LOW:
-                transitionBuffer.append(time.time())
-    GPIO.cleanup()
-except KeyboardInterrupt:
+    while nSamples < MAX_SAMPLES:
+        levels[nSamples] = readPin(sensorPin)
+        sampleTimesNs[nSamples] = tNs = clock()
+        nSamples += 1
+        if tNs > deadlineNs:
+            break
+finally:
     GPIO.cleanup()
-tDeltasUs = [round((t - s) * 1e6) for s, t in zip(transitionBuffer, transitionBuffer[1:])]
-temperatureF, relativeHumidity = decodeTDeltasUs(tDeltasUs)
-print("T: {}F, RH: {}%".format(temperatureF, round(relativeHumidity, 1)))
-# TODO - add checksum verification, buffer length checks
-# TODO - I don't want this blocking; need to figure out why I can't get the event detection callback
+
+# falling edges are where a high sample is followed by a low one
+levelChanges = np.diff(levels[:nSamples].astype(np.int8))
+fallingEdgeIndices = np.flatnonzero(levelChanges < 0) + 1
+edgeTicksUs = np.round(sampleTimesNs[fallingEdgeIndices] * NS_TO_US).astype(np.int64)
+print(
+    "Took {} samples in {:.2f} ms, found {} falling edges".format(
+        nSamples,
+        (sampleTimesNs[nSamples - 1] - sampleTimesNs[0]) * NS_TO_US * MS_TO_S,
+        len(edgeTicksUs),
+    )
+)
+
+validateEdgeCount(len(edgeTicksUs))
+payload, frameValid = decodeEdgeTicksToBytes(
+    edgeTicksUs[np.newaxis, :42], [len(edgeTicksUs)]
+)
+verifyPayloadChecksum([int(byte) for byte in payload[0]])
+relativeHumidity, temperatureF, _ = decodePayloadBytes(payload)
+print(
+    "T: {}F, RH: {}%".format(round(temperatureF[0], 2), round(relativeHumidity[0], 1))
+)
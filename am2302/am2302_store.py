@@ -0,0 +1,303 @@
+"""Fixed-size, memory-mapped ring buffers of timestamped sensor readings.
+
+Each sensor gets one preallocated file holding a ring of raw readings and
+rings of 1 minute and 1 hour min/max/mean aggregates, which are updated as
+readings are appended so dashboards never have to scan raw data. All state,
+including partially filled aggregation buckets, lives in the file, so a
+store picks up where it left off after a restart. Appends only touch the
+mapped pages in memory. The kernel writes dirty pages of a shared mapping
+back on its own schedule (after vm.dirty_expire_centisecs, 30 s by default),
+whatever the flush interval. The store also msyncs them every flush interval
+and when it is closed, so readings reach the card even if write-back is tuned
+to wait longer; the interval does not limit how often the card is written.
+"""
+
+import mmap
+import numpy as np
+import os
+import time
+
+STORE_MAGIC = b"AM2302RS"
+STORE_VERSION = 1
+RAW_CAPACITY = 7 * 24 * 60 * 30  # a week of reads every 2 s
+MINUTE_CAPACITY = 90 * 24 * 60  # 90 days
+HOUR_CAPACITY = 5 * 366 * 24  # 5 years
+# longest a reading waits for an explicit msync; see the module docstring
+FLUSH_INTERVAL_S = 300.0
+
+RAW_TIER = "raw"
+MINUTE_TIER = "1min"
+HOUR_TIER = "1h"
+TIER_BUCKETS_S = {MINUTE_TIER: 60.0, HOUR_TIER: 3600.0}
+
+READING_DTYPE = np.dtype(
+    [("timestampS", "<f8"), ("temperatureF", "<f4"), ("relativeHumidity", "<f4")]
+)
+AGGREGATE_DTYPE = np.dtype(
+    [
+        ("timestampS", "<f8"),  # start of the bucket
+        ("count", "<u4"),
+        ("temperatureFMin", "<f4"),
+        ("temperatureFMax", "<f4"),
+        ("temperatureFMean", "<f4"),
+        ("relativeHumidityMin", "<f4"),
+        ("relativeHumidityMax", "<f4"),
+        ("relativeHumidityMean", "<f4"),
+    ]
+)
+# running totals for the bucket currently being filled in each aggregate tier
+ACCUMULATOR_DTYPE = np.dtype(
+    [
+        ("bucketStartS", "<f8"),
+        ("count", "<u4"),
+        ("temperatureFMin", "<f4"),
+        ("temperatureFMax", "<f4"),
+        ("temperatureFSum", "<f8"),
+        ("relativeHumidityMin", "<f4"),
+        ("relativeHumidityMax", "<f4"),
+        ("relativeHumiditySum", "<f8"),
+    ]
+)
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("rawCapacity", "<u4"),
+        ("minuteCapacity", "<u4"),
+        ("hourCapacity", "<u4"),
+        # total records ever written to each ring; the next slot is this % capacity
+        ("rawWritten", "<u8"),
+        ("minuteWritten", "<u8"),
+        ("hourWritten", "<u8"),
+        ("minuteAccumulator", ACCUMULATOR_DTYPE),
+        ("hourAccumulator", ACCUMULATOR_DTYPE),
+    ]
+)
+
+
+class ReadingRing:
+    """One sensor's memory-mapped file of raw and downsampled readings."""
+
+    def __init__(
+        self,
+        path,
+        rawCapacity=RAW_CAPACITY,
+        minuteCapacity=MINUTE_CAPACITY,
+        hourCapacity=HOUR_CAPACITY,
+        flushIntervalS=FLUSH_INTERVAL_S,
+    ):
+        """
+        Open the ring at path, creating and preallocating it if needed. The
+        capacities of an existing file take precedence over the arguments.
+        """
+        self.path = path
+        self.flushIntervalS = flushIntervalS
+        self.lastFlushS = time.monotonic()
+        if not os.path.exists(path):
+            self.create(path, rawCapacity, minuteCapacity, hourCapacity)
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.header = np.frombuffer(self.map, HEADER_DTYPE, 1)[0]
+        if (
+            self.header["magic"] != STORE_MAGIC
+            or self.header["version"] != STORE_VERSION
+        ):
+            self.close()
+            raise ValueError("{} is not a reading store".format(path))
+
+        offset = HEADER_DTYPE.itemsize
+        self.raw = np.frombuffer(
+            self.map, READING_DTYPE, int(self.header["rawCapacity"]), offset
+        )
+        offset += self.raw.nbytes
+        self.tiers = {}
+        for tier, capacityField in (
+            (MINUTE_TIER, "minuteCapacity"),
+            (HOUR_TIER, "hourCapacity"),
+        ):
+            ring = np.frombuffer(
+                self.map, AGGREGATE_DTYPE, int(self.header[capacityField]), offset
+            )
+            self.tiers[tier] = ring
+            offset += ring.nbytes
+
+    @staticmethod
+    def create(path, rawCapacity, minuteCapacity, hourCapacity):
+        size = (
+            HEADER_DTYPE.itemsize
+            + rawCapacity * READING_DTYPE.itemsize
+            + (minuteCapacity + hourCapacity) * AGGREGATE_DTYPE.itemsize
+        )
+        header = np.zeros(1, HEADER_DTYPE)
+        header["magic"] = STORE_MAGIC
+        header["version"] = STORE_VERSION
+        header["rawCapacity"] = rawCapacity
+        header["minuteCapacity"] = minuteCapacity
+        header["hourCapacity"] = hourCapacity
+        with open(path, "wb") as file:
+            file.write(header.tobytes())
+            file.truncate(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.map is None:
+            return
+        self.map.flush()
+        # drop our views into the map before closing it
+        self.header = self.raw = None
+        self.tiers = {}
+        self.map.close()
+        self.map = None
+        self.file.close()
+
+    def flush(self):
+        self.map.flush()
+        self.lastFlushS = time.monotonic()
+
+    def append(self, temperatureF, relativeHumidity, timestampS=None):
+        """Store one reading and fold it into the aggregate tiers in O(1).
+
+        Args:
+            timestampS (float): wall clock time of the reading; defaults to now
+        """
+        if timestampS is None:
+            timestampS = time.time()
+        self.writeRecord(
+            self.raw, "rawWritten", (timestampS, temperatureF, relativeHumidity)
+        )
+        for tier, accumulatorField, writtenField in (
+            (MINUTE_TIER, "minuteAccumulator", "minuteWritten"),
+            (HOUR_TIER, "hourAccumulator", "hourWritten"),
+        ):
+            self.accumulate(
+                tier,
+                self.header[accumulatorField],
+                writtenField,
+                timestampS,
+                temperatureF,
+                relativeHumidity,
+            )
+        if time.monotonic() - self.lastFlushS > self.flushIntervalS:
+            self.flush()
+
+    def writeRecord(self, ring, writtenField, record):
+        written = int(self.header[writtenField])
+        ring[written % len(ring)] = record
+        self.header[writtenField] = written + 1
+
+    def accumulate(
+        self, tier, acc, writtenField, timestampS, temperatureF, relativeHumidity
+    ):
+        bucketS = TIER_BUCKETS_S[tier]
+        bucketStartS = (timestampS // bucketS) * bucketS
+        if acc["count"] and acc["bucketStartS"] != bucketStartS:
+            self.writeRecord(self.tiers[tier], writtenField, self.finishBucket(acc))
+            acc["count"] = 0
+        if not acc["count"]:
+            acc["bucketStartS"] = bucketStartS
+            acc["temperatureFMin"] = acc["temperatureFMax"] = temperatureF
+            acc["relativeHumidityMin"] = acc["relativeHumidityMax"] = relativeHumidity
+            acc["temperatureFSum"] = acc["relativeHumiditySum"] = 0.0
+        acc["count"] += 1
+        acc["temperatureFMin"] = min(acc["temperatureFMin"], temperatureF)
+        acc["temperatureFMax"] = max(acc["temperatureFMax"], temperatureF)
+        acc["temperatureFSum"] += temperatureF
+        acc["relativeHumidityMin"] = min(acc["relativeHumidityMin"], relativeHumidity)
+        acc["relativeHumidityMax"] = max(acc["relativeHumidityMax"], relativeHumidity)
+        acc["relativeHumiditySum"] += relativeHumidity
+
+    @staticmethod
+    def finishBucket(acc):
+        count = acc["count"]
+        return (
+            acc["bucketStartS"],
+            count,
+            acc["temperatureFMin"],
+            acc["temperatureFMax"],
+            acc["temperatureFSum"] / count,
+            acc["relativeHumidityMin"],
+            acc["relativeHumidityMax"],
+            acc["relativeHumiditySum"] / count,
+        )
+
+    def chronologicalSegments(self, tier):
+        """Return the ring's filled slots as up to two arrays, oldest first."""
+        if tier == RAW_TIER:
+            ring, written = self.raw, int(self.header["rawWritten"])
+        elif tier == MINUTE_TIER:
+            ring, written = self.tiers[tier], int(self.header["minuteWritten"])
+        elif tier == HOUR_TIER:
+            ring, written = self.tiers[tier], int(self.header["hourWritten"])
+        else:
+            raise ValueError("Unknown tier {}".format(tier))
+        if written <= len(ring):
+            return [ring[:written]]
+        head = written % len(ring)
+        return [ring[head:], ring[:head]]
+
+    def query(self, startS, endS, tier=RAW_TIER):
+        """Return a copy of the records of a tier with startS <= timestampS < endS.
+
+        Uses binary search within the ring, so the cost depends on the size of
+        the result rather than of the ring. Aggregate tiers only contain
+        completed buckets.
+        """
+        parts = []
+        for segment in self.chronologicalSegments(tier):
+            times = segment["timestampS"]
+            first, last = np.searchsorted(times, [startS, endS])
+            if last > first:
+                parts.append(segment[first:last])
+        dtype = READING_DTYPE if tier == RAW_TIER else AGGREGATE_DTYPE
+        return np.concatenate(parts) if parts else np.empty(0, dtype)
+
+    def latest(self):
+        written = int(self.header["rawWritten"])
+        if not written:
+            return None
+        return self.raw[(written - 1) % len(self.raw)].copy()
+
+    def __len__(self):
+        return min(int(self.header["rawWritten"]), len(self.raw))
+
+
+class ReadingStore:
+    """A directory of ReadingRings, one per sensor."""
+
+    def __init__(self, directory, **ringOptions):
+        self.directory = directory
+        self.ringOptions = ringOptions
+        self.rings = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def ring(self, sensorId):
+        if sensorId not in self.rings:
+            path = os.path.join(self.directory, "sensor-{}.ring".format(sensorId))
+            self.rings[sensorId] = ReadingRing(path, **self.ringOptions)
+        return self.rings[sensorId]
+
+    def append(self, sensorId, temperatureF, relativeHumidity, timestampS=None):
+        self.ring(sensorId).append(temperatureF, relativeHumidity, timestampS)
+
+    def query(self, sensorId, startS, endS, tier=RAW_TIER):
+        return self.ring(sensorId).query(startS, endS, tier)
+
+    def flush(self):
+        for ring in self.rings.values():
+            ring.flush()
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
@@ -0,0 +1,262 @@
+"""Benchmark speed and robustness of the AM2302 decode and validation path.
+
+Builds a corpus of synthetic edge captures - clean, jittery, missing the
+leading edge, missing an inner edge, with corrupted bits, with several
+edges dropped, and empty - and reports the throughput of each AM2302Reader
+decode step plus how often the reader classifies each kind of capture
+correctly. Results can be saved as a baseline and later runs compared
+against it, exiting non-zero on a regression.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+from am2302 import (
+    AM2302ChecksumFailed,
+    AM2302InsufficientDataRecieved,
+    AM2302NoData,
+    AM2302Reader,
+)
+from am2302_decode import decodeEdgeTickFrames, packEdgeTickFrames
+from am2302_replay import ONE_BIT_US, ZERO_BIT_US, synthesizeEdgeTicks
+
+SUCCESS = "success"
+NO_DATA = "noData"
+SHORT_FRAME = "shortFrame"
+CHECKSUM_FAILED = "checksumFailed"
+# a run regresses if throughput falls by more than this fraction of baseline
+THROUGHPUT_TOLERANCE = 0.2
+ACCURACY_TOLERANCE = 0.005
+N_REPEATS = 3
+# a batch decode of the whole corpus takes milliseconds, so repeat it more
+N_BATCH_REPEATS = 20
+
+
+def dropLeadingEdge(edgeTicksUs, rng):
+    return edgeTicksUs[1:]
+
+
+def dropInnerEdge(edgeTicksUs, rng):
+    index = rng.randrange(2, len(edgeTicksUs) - 1)
+    return edgeTicksUs[:index] + edgeTicksUs[index + 1 :]
+
+
+def dropSeveralEdges(edgeTicksUs, rng):
+    for count in range(rng.randint(2, 10)):
+        edgeTicksUs = dropInnerEdge(edgeTicksUs, rng)
+    return edgeTicksUs
+
+
+def corruptBit(edgeTicksUs, rng):
+    """Turn one data bit's pulse from a 0 into a 1 or vice versa."""
+    index = rng.randrange(2, len(edgeTicksUs))
+    pulseUs = edgeTicksUs[index] - edgeTicksUs[index - 1]
+    shiftUs = round(ONE_BIT_US - ZERO_BIT_US)
+    shiftUs = -shiftUs if pulseUs > (ONE_BIT_US + ZERO_BIT_US) / 2 else shiftUs
+    return edgeTicksUs[:index] + [tick + shiftUs for tick in edgeTicksUs[index:]]
+
+
+def dropAllEdges(edgeTicksUs, rng):
+    return []
+
+
+# name: (pulse jitter in us, fault to inject, outcome the reader should report)
+SCENARIOS = {
+    "clean": (0.0, None, SUCCESS),
+    "jitter": (6.0, None, SUCCESS),
+    "missingLeadingEdge": (3.0, dropLeadingEdge, SUCCESS),
+    "missingInnerEdge": (3.0, dropInnerEdge, SUCCESS),
+    "corruptedBit": (3.0, corruptBit, CHECKSUM_FAILED),
+    "droppedEdges": (3.0, dropSeveralEdges, SHORT_FRAME),
+    "noData": (0.0, dropAllEdges, NO_DATA),
+}
+
+
+def buildCorpus(framesPerScenario, seed):
+    """Return {scenario: [(edgeTicksUs, relativeHumidity, temperatureF)]}."""
+    rng = random.Random(seed)
+    corpus = {}
+    for name, (jitterUs, fault, _) in SCENARIOS.items():
+        frames = []
+        for count in range(framesPerScenario):
+            relativeHumidity = round(rng.uniform(0.0, 99.9), 1)
+            temperatureC = round(rng.uniform(-40.0, 80.0), 1)
+            edgeTicksUs = synthesizeEdgeTicks(
+                relativeHumidity, temperatureC, jitterUs=jitterUs, rng=rng
+            )
+            if fault is not None:
+                edgeTicksUs = fault(edgeTicksUs, rng)
+            frames.append(
+                (edgeTicksUs, relativeHumidity, temperatureC * 9.0 / 5.0 + 32.0)
+            )
+        corpus[name] = frames
+    return corpus
+
+
+def classify(reader, edgeTicksUs):
+    """Run the reader's decode path on a capture as readSensorOnce would."""
+    reader.clearPreviousRead()
+    reader.fallingEdgeTimesUs = list(edgeTicksUs)
+    try:
+        reader.validatePayload()
+        try:
+            reader.processSensorData()
+        except AM2302ChecksumFailed:
+            if not reader.recoverShortFrame():
+                raise
+    except AM2302NoData:
+        return NO_DATA
+    except AM2302InsufficientDataRecieved:
+        return SHORT_FRAME
+    except AM2302ChecksumFailed:
+        return CHECKSUM_FAILED
+    return SUCCESS
+
+
+def measureAccuracy(reader, corpus):
+    """Fraction of captures per scenario given the expected classification.
+
+    A capture classified as a success also needs its decoded values to match
+    the ones that were encoded.
+    """
+    accuracy = {}
+    for name, frames in corpus.items():
+        expected = SCENARIOS[name][2]
+        correct = 0
+        for edgeTicksUs, relativeHumidity, temperatureF in frames:
+            outcome = classify(reader, edgeTicksUs)
+            if outcome != expected:
+                continue
+            if outcome == SUCCESS and (
+                abs(reader.relativeHumidity - relativeHumidity) > 0.05
+                or abs(reader.temperatureF - temperatureF) > 0.1
+            ):
+                continue
+            correct += 1
+        accuracy[name] = correct / len(frames)
+    return accuracy
+
+
+def opsPerSecond(operation, inputs):
+    """Best of N_REPEATS passes of operation over inputs, in calls per second."""
+    bestS = float("inf")
+    for repeat in range(N_REPEATS):
+        startS = time.perf_counter()
+        for item in inputs:
+            operation(item)
+        bestS = min(bestS, time.perf_counter() - startS)
+    return len(inputs) / bestS
+
+
+def measureThroughput(reader, corpus):
+    allFrames = [frame[0] for frames in corpus.values() for frame in frames]
+    decodable = [frame for frame in allFrames if len(frame) in (41, 42)]
+
+    def setEdges(edgeTicksUs):
+        reader.fallingEdgeTimesUs = edgeTicksUs
+        return reader
+
+    payloads = [setEdges(frame).convertEdgeTimesIntoBytes() for frame in decodable]
+
+    def validate(edgeTicksUs):
+        setEdges(edgeTicksUs)
+        try:
+            reader.validatePayload()
+        except (AM2302NoData, AM2302InsufficientDataRecieved):
+            pass
+
+    def verify(payload):
+        reader.setChecksum(payload)
+        reader.verifyChecksum(payload)
+
+    validPayloads = [p for p in payloads if (sum(p[:4]) & 0xFF) == p[4]]
+    edgeTicksUs, edgeCounts = packEdgeTickFrames(decodable)
+    batchS = float("inf")
+    for repeat in range(N_BATCH_REPEATS):
+        startS = time.perf_counter()
+        decodeEdgeTickFrames(edgeTicksUs, edgeCounts)
+        batchS = min(batchS, time.perf_counter() - startS)
+
+    return {
+        "validatePayload": opsPerSecond(validate, allFrames),
+        "convertEdgeTimesIntoBytes": opsPerSecond(
+            lambda frame: setEdges(frame).convertEdgeTimesIntoBytes(), decodable
+        ),
+        "verifyChecksum": opsPerSecond(verify, validPayloads),
+        "convertBytesToPhysicalReadings": opsPerSecond(
+            reader.convertBytesToPhysicalReadings, payloads
+        ),
+        "decodeEdgeTickFrames (per frame)": len(decodable) / batchS,
+    }
+
+
+def findRegressions(results, baseline):
+    regressions = []
+    for name, opsPerS in results["throughputOpsPerS"].items():
+        baseOpsPerS = baseline["throughputOpsPerS"].get(name)
+        if baseOpsPerS and opsPerS < baseOpsPerS * (1.0 - THROUGHPUT_TOLERANCE):
+            regressions.append(
+                "{} throughput {:.0f} ops/s < baseline {:.0f} ops/s".format(
+                    name, opsPerS, baseOpsPerS
+                )
+            )
+    for name, accuracy in results["accuracy"].items():
+        baseAccuracy = baseline["accuracy"].get(name)
+        if baseAccuracy is not None and accuracy < baseAccuracy - ACCURACY_TOLERANCE:
+            regressions.append(
+                "{} accuracy {:.4f} < baseline {:.4f}".format(
+                    name, accuracy, baseAccuracy
+                )
+            )
+    return regressions
+
+
+def runBenchmarks(framesPerScenario, seed):
+    corpus = buildCorpus(framesPerScenario, seed)
+    reader = AM2302Reader()
+    # the reader warns on every 41-edge frame and when deleted; keep that out
+    # of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = {
+            "framesPerScenario": framesPerScenario,
+            "seed": seed,
+            "throughputOpsPerS": measureThroughput(reader, corpus),
+            "accuracy": measureAccuracy(reader, corpus),
+        }
+        del reader
+    return results
+
+
+def printResults(results):
+    print("Throughput (ops/s):")
+    for name, opsPerS in results["throughputOpsPerS"].items():
+        print("  {:<36} {:>12.0f}".format(name, opsPerS))
+    print("Classification accuracy:")
+    for name, accuracy in results["accuracy"].items():
+        print("  {:<36} {:>12.4f}".format(name, accuracy))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=2000, help="per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-baseline", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this JSON file")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.frames, args.seed)
+    printResults(results)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = findRegressions(results, json.load(file))
+        for regression in regressions:
+            print("REGRESSION: {}".format(regression))
+        sys.exit(1 if regressions else 0)
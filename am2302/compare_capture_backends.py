@@ -0,0 +1,58 @@
+"""Compare edge drop rates of the callback and notification pipe capture backends.
+
+Alternates reads of the same sensor between the two backends over one pigpio
+connection, so both see the same sensor, wiring and system load.
+"""
+
+import argparse
+import collections
+import pigpio
+
+from am2302 import (
+    CALLBACK_CAPTURE,
+    NOTIFY_CAPTURE,
+    SENSOR_PIN,
+    AM2302Reader,
+    PiConnectionError,
+)
+
+
+def compareCaptureBackends(pin, nReads):
+    gpio = pigpio.pi()
+    if not gpio.connected:
+        raise PiConnectionError("Failed to connect to pigpio")
+    readers = {
+        backend: AM2302Reader(pin, gpio=gpio, captureBackend=backend)
+        for backend in (CALLBACK_CAPTURE, NOTIFY_CAPTURE)
+    }
+    failures = {backend: collections.Counter() for backend in readers}
+    try:
+        for count in range(nReads):
+            for backend, reader in readers.items():
+                try:
+                    reader.readSensor()
+                except Exception as e:
+                    failures[backend][type(e).__name__] += 1
+                # the sensor's minimum interval applies across both readers
+                for other in readers.values():
+                    other.lastRequestTimeS = reader.lastRequestTimeS
+    finally:
+        for reader in readers.values():
+            reader.cleanUpGpio()
+        gpio.stop()
+
+    for backend, reader in readers.items():
+        print("{} backend:".format(backend))
+        edgeCounts = dict(sorted(reader.stats.edgeCounts.items()))
+        print("  edges per read: {}".format(edgeCounts))
+        print("  short frame rate: {}".format(reader.stats.shortFrameRate))
+        print("  failures: {}".format(dict(failures[backend])))
+        print("  mean latency: {} s".format(reader.meanReadLatencyS))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pin", type=int, default=SENSOR_PIN)
+    parser.add_argument("--reads", type=int, default=50, help="reads per backend")
+    args = parser.parse_args()
+    compareCaptureBackends(args.pin, args.reads)
@@ -0,0 +1,127 @@
+import collections
+import logging
+import time
+
+Level = collections.namedtuple('Level', 'width height fps quality')
+
+
+def make_levels(width, height, fps, quality=85, min_quality=30, min_fps=5,
+                min_width=320):
+    """Build a ladder of settings from the given best down to the bounds.
+
+    Each step gives up a little: quality first, then frame rate, then
+    resolution, so the picture degrades gradually as the link gets worse.
+    """
+    levels = [Level(width, height, fps, quality)]
+    while True:
+        width, height, fps, quality = levels[-1]
+        if quality - 15 >= min_quality:
+            quality -= 15
+        elif fps * 2 // 3 >= min_fps:
+            fps = fps * 2 // 3
+        elif width * 3 // 4 >= min_width:
+            # Keep the aspect ratio and the multiples of 16 the encoder wants
+            width = width * 3 // 4 // 16 * 16
+            height = height * 3 // 4 // 16 * 16
+        else:
+            return levels
+        levels.append(Level(width, height, fps, quality))
+
+
+class AdaptiveQuality(object):
+    """Step camera settings down when the link is congested and back up.
+
+    Call update() every interval seconds with the send queue fill (0 to 1)
+    and running totals of frames offered, frames delivered and bytes sent.
+    The link counts as congested when the queue is at least high full or
+    fewer than min_delivered of the offered frames got through, and as clear
+    when the queue is at most low full and nearly everything got through.
+    Settings drop one level after down_after congested updates in a row and
+    rise one level after up_after clear ones, and never change within hold
+    seconds of the last change, so one bad second doesn't make them
+    oscillate. apply(level) is called to put a new level into effect.
+
+    Queue fill and the delivered ratio are the only inputs to the decision:
+    they show whether the socket is keeping up with what is offered, whatever
+    the link speed. The throughput worked out from bytes_sent is only logged,
+    to help tune the levels.
+    """
+
+    def __init__(self, levels, apply, start=0, high=0.5, low=0.1,
+                 min_delivered=0.9, down_after=2, up_after=10, hold=5.0):
+        self.levels = levels
+        self.apply = apply
+        self.index = start
+        self.high = high
+        self.low = low
+        self.min_delivered = min_delivered
+        self.down_after = down_after
+        self.up_after = up_after
+        self.hold = hold
+        self.congested = 0
+        self.clear = 0
+        self.changed = time.monotonic()
+        self.last = None  # (time, offered, delivered, bytes) at last update
+        self.throughput = 0.0  # bytes/s delivered since the last update
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def update(self, queue_fill, offered, delivered, bytes_sent):
+        now = time.monotonic()
+        last, self.last = self.last, (now, offered, delivered, bytes_sent)
+        if last is None:
+            return self.level
+        last_time, last_offered, last_delivered, last_bytes = last
+        new_offered = offered - last_offered
+        # Totals over a changing set of clients can go backwards
+        ratio = (
+            (delivered - last_delivered) / new_offered
+            if new_offered > 0 else 1.0)
+        self.throughput = max(0, bytes_sent - last_bytes) / (now - last_time)
+
+        if queue_fill >= self.high or ratio < self.min_delivered:
+            self.congested += 1
+            self.clear = 0
+        elif queue_fill <= self.low and ratio >= 0.99:
+            self.clear += 1
+            self.congested = 0
+        else:
+            self.congested = self.clear = 0
+        logging.debug(
+            'Link: queue %.0f%%, delivered %.0f%%, %.0f kB/s at %s',
+            queue_fill * 100, ratio * 100, self.throughput / 1000, self.level)
+
+        if now - self.changed < self.hold:
+            return self.level
+        if (self.congested >= self.down_after and
+                self.index < len(self.levels) - 1):
+            self._change(self.index + 1, 'congested', queue_fill, ratio)
+        elif self.clear >= self.up_after and self.index > 0:
+            self._change(self.index - 1, 'clear', queue_fill, ratio)
+        return self.level
+
+    def _change(self, index, reason, queue_fill, ratio):
+        logging.info(
+            'Link %s (queue %.0f%%, delivered %.0f%%, %.0f kB/s): %s -> %s',
+            reason, queue_fill * 100, ratio * 100, self.throughput / 1000,
+            self.level, self.levels[index])
+        self.index = index
+        self.congested = self.clear = 0
+        self.changed = time.monotonic()
+        self.apply(self.level)
+
+
+def restart_recording(camera, output, level):
+    """Apply a level to a picamera MJPEG recording.
+
+    The frame rate and encoder settings can't change while recording, so
+    this briefly stops it. The sensor keeps its resolution and the GPU
+    resizes frames down to the level's.
+    """
+    camera.stop_recording()
+    camera.framerate = level.fps
+    camera.start_recording(
+        output, format='mjpeg', quality=level.quality,
+        resize=(level.width, level.height))
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import time
+from frame_ring import MAX_LAG, ClientDelivery, ClientTooSlow, stream_stats
+
+# Longest request header we accept
+MAX_REQUEST_SIZE = 8192
+# Pollers may keep /snapshot.jpg but must check it's current, which the ETag
+# (the frame's sequence number) makes a cheap 304 when it is
+SNAPSHOT_CACHE_CONTROL = 'no-cache'
+# Sequence numbers start again at 1 in every process, so ETags also carry
+# when this one started; a tag from before a restart then never matches
+ETAG_PREFIX = '%x' % int(time.time() * 1000)
+
+
+def snapshot_etag(sequence):
+    return '"%s-%d"' % (ETAG_PREFIX, sequence)
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches etag."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in [
+        tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class AsyncMJPEGServer(object):
+    """Serve /index.html and /stream.mjpg from a FrameRing on one event loop.
+
+    Every viewer is a coroutine rather than a thread. New frames wake all of
+    them through a single asyncio.Event, and each one sends the newest frame
+    with a non-blocking write, then waits for the socket to take it. While a
+    viewer waits, the frames it misses are skipped, so a slow link falls
+    behind by at most one frame.
+    """
+
+    def __init__(self, ring, page, max_lag=MAX_LAG, gate=None):
+        self.ring = ring
+        self.page = page.encode('utf-8')
+        self.max_lag = max_lag
+        self.clients = set()
+        # If frames pass through a MotionGate, its counts go in /stats
+        self.gate = gate
+        self.loop = None
+        self.new_frame = None
+
+    def _frame_committed(self, sequence):
+        # Called from the camera thread
+        self.loop.call_soon_threadsafe(self._wake_clients)
+
+    def _wake_clients(self):
+        self.new_frame.set()
+        self.new_frame = asyncio.Event()
+
+    def _listen_for_frames(self):
+        self.loop = asyncio.get_running_loop()
+        self.new_frame = asyncio.Event()
+        self.ring.listeners.append(self._frame_committed)
+
+    async def serve(self, host='', port=8000):
+        self._listen_for_frames()
+        server = await asyncio.start_server(
+            self.handle_client, host, port, limit=MAX_REQUEST_SIZE)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.ring.listeners.remove(self._frame_committed)
+
+    def serve_forever(self, host='', port=8000):
+        asyncio.run(self.serve(host, port))
+
+    async def handle_client(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            path = lines[0].split(' ', 2)[1]
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                IndexError):
+            writer.close()
+            return
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            if path == '/':
+                writer.write(
+                    b'HTTP/1.0 301 Moved Permanently\r\n'
+                    b'Location: /index.html\r\n\r\n')
+            elif path == '/index.html':
+                writer.write(
+                    b'HTTP/1.0 200 OK\r\n'
+                    b'Content-Type: text/html\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(self.page))
+                writer.write(self.page)
+            elif path == '/stream.mjpg':
+                # stream() reports its own disconnects; nothing left to drain
+                await self.stream(writer, address)
+                return
+            elif path == '/snapshot.jpg':
+                self.snapshot(writer, headers.get('if-none-match'))
+            elif path == '/stats':
+                content = json.dumps(self.stats()).encode('utf-8')
+                writer.write(
+                    b'HTTP/1.0 200 OK\r\n'
+                    b'Content-Type: application/json\r\n'
+                    b'Cache-Control: no-cache\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(content))
+                writer.write(content)
+            else:
+                writer.write(b'HTTP/1.0 404 Not Found\r\n\r\n')
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logging.warning('Lost client %s: %s', address, str(e))
+        finally:
+            writer.close()
+
+    def stats(self):
+        return stream_stats(self.ring, self.clients, self.gate)
+
+    def snapshot(self, writer, if_none_match):
+        # Pollers that already have the newest frame get a 304 without it
+        # being touched
+        sequence = self.ring.sequence
+        frame = None
+        if not (sequence and etag_matches(if_none_match, snapshot_etag(sequence))):
+            sequence, frame = self.ring.snapshot()
+            if frame is None:
+                writer.write(b'HTTP/1.0 503 Service Unavailable\r\n\r\n')
+                return
+        headers = (
+            'ETag: %s\r\nCache-Control: %s\r\n' % (
+                snapshot_etag(sequence), SNAPSHOT_CACHE_CONTROL)
+        ).encode('latin-1')
+        if frame is None:
+            writer.write(b'HTTP/1.0 304 Not Modified\r\n' + headers + b'\r\n')
+            return
+        writer.write(
+            b'HTTP/1.0 200 OK\r\n' + headers +
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: %d\r\n\r\n' % len(frame))
+        writer.write(frame)
+
+    async def stream(self, writer, address):
+        writer.write(
+            b'HTTP/1.0 200 OK\r\n'
+            b'Age: 0\r\n'
+            b'Cache-Control: no-cache, private\r\n'
+            b'Pragma: no-cache\r\n'
+            b'Content-Type: multipart/x-mixed-replace; boundary=FRAME\r\n\r\n')
+        # Only ever buffer the frame being sent: drain() then waits until the
+        # kernel has taken all of it, so we never hold a view of a slot the
+        # camera is about to reuse
+        writer.transport.set_write_buffer_limits(high=0)
+        client = ClientDelivery(self.ring, address, self.max_lag)
+        self.clients.add(client)
+        try:
+            while True:
+                frame = client.take_latest()
+                if frame is None:
+                    await self.new_frame.wait()
+                    continue
+                writer.write(
+                    b'--FRAME\r\n'
+                    b'Content-Type: image/jpeg\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(frame))
+                writer.write(frame)
+                writer.write(b'\r\n')
+                try:
+                    await asyncio.wait_for(writer.drain(), self.max_lag)
+                except asyncio.TimeoutError:
+                    raise ClientTooSlow(
+                        'frame %d not sent within %.2fs' % (
+                            client.sequence, self.max_lag))
+                client.frame_sent(len(frame))
+        except (ClientTooSlow, ConnectionError) as e:
+            logging.warning(
+                'Removed streaming client %s after %d frames, %d dropped: %s',
+                address, client.sent, client.dropped, str(e))
+        finally:
+            self.clients.discard(client)
+            # Not close(): that would still send whatever the transport has
+            # buffered, which may be a view of a slot the camera is now
+            # overwriting
+            writer.transport.abort()
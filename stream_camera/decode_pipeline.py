@@ -0,0 +1,119 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# decode workers; cv2.imdecode releases the GIL so threads decode in parallel
+WORKERS = 3
+# frames received but not yet displayed before the oldest is dropped
+MAX_PENDING = 6
+
+
+def decode_jpeg(data):
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class StageTimer(object):
+    """Count and time the frames passing through one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.frames += 1
+            self.total += seconds
+            self.longest = max(self.longest, seconds)
+
+    def __str__(self):
+        mean = self.total / self.frames if self.frames else 0.0
+        return '%s: %d frames, mean %.1f ms, max %.1f ms' % (
+            self.name, self.frames, mean * 1000, self.longest * 1000)
+
+
+class DecodePipeline(object):
+    """Receive, decode and hand over frames in three overlapping stages.
+
+    A network thread takes frames from a FrameReceiver and submits each one
+    to a pool of decode workers, queueing the futures in arrival order. The
+    consumer iterates over the pipeline to get (sequence, image) pairs in
+    that same order, using the receiver's sequence numbers. When decoding or
+    the consumer falls behind and max_pending frames are waiting, the oldest
+    is dropped so the consumer always works on recent frames.
+    """
+
+    def __init__(self, receiver, decode=decode_jpeg, workers=WORKERS,
+                 max_pending=MAX_PENDING):
+        self.receiver = receiver
+        self.decode = decode
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.network = StageTimer('network')
+        self.decoding = StageTimer('decode')
+        self.consumer = StageTimer('consumer')
+        self.thread = threading.Thread(target=self._receive, daemon=True)
+        self.thread.start()
+
+    def _decode(self, data):
+        start = time.monotonic()
+        image = self.decode(data)
+        self.decoding.add(time.monotonic() - start)
+        return image
+
+    def _receive(self):
+        try:
+            while True:
+                start = time.monotonic()
+                frame = self.receiver.receive()
+                if frame is None:
+                    break
+                # The receiver reuses its buffer, so take a copy for the worker
+                data = bytes(frame)
+                self.network.add(time.monotonic() - start)
+                self._submit(
+                    self.receiver.sequence,
+                    self.pool.submit(self._decode, data))
+        finally:
+            # Wake the consumer at the end of the stream
+            self.pending.put(None)
+
+    def _submit(self, sequence, future):
+        while True:
+            try:
+                self.pending.put_nowait((sequence, future))
+                return
+            except queue.Full:
+                pass
+            try:
+                stale = self.pending.get_nowait()[1]
+            except queue.Empty:
+                continue
+            stale.cancel()
+            self.dropped += 1
+
+    def __iter__(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            sequence, future = item
+            image = future.result()
+            start = time.monotonic()
+            yield sequence, image
+            self.consumer.add(time.monotonic() - start)
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+    def report(self):
+        return '\n'.join([
+            str(self.network), str(self.decoding), str(self.consumer),
+            'dropped: %d frames' % self.dropped])
@@ -0,0 +1,296 @@
+"""A stand-in for picamera.PiCamera that needs no camera.
+
+FakePiCamera produces JPEG frames, either generated test patterns or frames
+replayed from an MJPEG file (such as a frame_recorder segment), at the
+configured resolution and frame rate. It writes them to outputs in chunks
+the way the real encoder does, so the stream scripts can be run, profiled
+and load-tested on any Linux machine. Only what those scripts use is
+implemented.
+"""
+
+import io
+import itertools
+import threading
+import time
+from PIL import Image, ImageDraw
+
+# the encoder hands over each frame in buffers of about this size
+CHUNK_SIZE = 32 * 1024
+RESOLUTIONS = {
+    'VGA': (640, 480),
+    'SVGA': (800, 600),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+class PiCameraNotRecording(Exception):
+    """Raised when waiting on or stopping a recording that isn't running."""
+    pass
+
+
+def parse_resolution(resolution):
+    if isinstance(resolution, str):
+        if resolution in RESOLUTIONS:
+            return RESOLUTIONS[resolution]
+        width, height = resolution.lower().split('x')
+        return int(width), int(height)
+    width, height = resolution
+    return int(width), int(height)
+
+
+def jpeg_end(data, start):
+    """Return the offset just past the JPEG starting at start, or None.
+
+    Walks the marker segments, skipping each by its length, so the start of
+    image marker of an embedded thumbnail (in an EXIF APP1 segment, as still
+    and capture_sequence JPEGs have) is never mistaken for a new frame.
+    After a start of scan, the entropy-coded data is searched for the next
+    marker: there a 0xFF is only followed by 0x00 (stuffing) or a restart
+    marker. Returns None if data ends before the end of image marker.
+    """
+    position = start + 2
+    while position + 1 < len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xD9:
+            return position + 2
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Fill byte, or a marker without a length
+            position += 1 if marker == 0xFF else 2
+            continue
+        if position + 4 > len(data):
+            return None
+        position += 2 + int.from_bytes(data[position + 2:position + 4], 'big')
+        if marker != 0xDA:
+            continue
+        while True:
+            position = data.find(b'\xff', position)
+            if position < 0 or position + 1 >= len(data):
+                return None
+            following = data[position + 1]
+            if following != 0x00 and not 0xD0 <= following <= 0xD7:
+                break
+            position += 2
+    return None
+
+
+def split_mjpeg(data):
+    """Split an MJPEG file into its JPEG frames.
+
+    Frames are found by walking their marker segments (see jpeg_end), not by
+    searching for start of image markers, which also start embedded
+    thumbnails. A trailing frame cut short is left out.
+    """
+    frames = []
+    start = data.find(b'\xff\xd8')
+    while start >= 0:
+        end = jpeg_end(data, start)
+        if end is None:
+            break
+        frames.append(data[start:end])
+        start = data.find(b'\xff\xd8', end)
+    return frames
+
+
+class TestPattern(object):
+    """Colour bars with a moving bar, frame number and time on them."""
+
+    def __init__(self):
+        self.count = 0
+
+    def frame(self, size, quality):
+        width, height = size
+        image = Image.new('RGB', size)
+        draw = ImageDraw.Draw(image)
+        colours = [(192, 192, 192), (192, 192, 0), (0, 192, 192), (0, 192, 0),
+                   (192, 0, 192), (192, 0, 0), (0, 0, 192)]
+        bar = width / len(colours)
+        for i, colour in enumerate(colours):
+            draw.rectangle([i * bar, 0, (i + 1) * bar, height], fill=colour)
+        x = (self.count * 4) % width
+        draw.rectangle([x, 0, x + 8, height], fill=(255, 255, 255))
+        draw.text(
+            (10, 10), 'frame %d  %s' % (self.count, time.strftime('%H:%M:%S')),
+            fill=(0, 0, 0))
+        self.count += 1
+        stream = io.BytesIO()
+        image.save(stream, 'JPEG', quality=quality)
+        return stream.getvalue()
+
+
+class MJPEGReplay(object):
+    """Frames from an MJPEG file, looped, resized if they don't fit."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.frames = split_mjpeg(f.read())
+        if not self.frames:
+            raise ValueError('No JPEG frames in %s' % path)
+        self.cycle = itertools.cycle(self.frames)
+
+    def frame(self, size, quality):
+        data = next(self.cycle)
+        image = Image.open(io.BytesIO(data))
+        if image.size == tuple(size):
+            return data
+        stream = io.BytesIO()
+        image.resize(size).save(stream, 'JPEG', quality=quality)
+        return stream.getvalue()
+
+
+class FakePiCamera(object):
+    def __init__(self, resolution=(1280, 720), framerate=30, source=None,
+                 chunk_size=CHUNK_SIZE):
+        self._resolution = parse_resolution(resolution)
+        self._framerate = framerate
+        self.source = MJPEGReplay(source) if source else TestPattern()
+        self.chunk_size = chunk_size
+        self.rotation = 0
+        self.output = None
+        self.recording = None
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.recording is not None:
+            self.stop_recording()
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, value):
+        self._check_idle('resolution')
+        self._resolution = parse_resolution(value)
+
+    @property
+    def framerate(self):
+        return self._framerate
+
+    @framerate.setter
+    def framerate(self, value):
+        self._check_idle('framerate')
+        self._framerate = value
+
+    def _check_idle(self, setting):
+        if self.recording is not None:
+            raise RuntimeError("Can't change %s while recording" % setting)
+
+    def start_preview(self, **options):
+        pass
+
+    def stop_preview(self):
+        pass
+
+    def _frames(self, size, quality):
+        """Yield JPEG frames, paced to the frame rate."""
+        interval = 1.0 / self._framerate
+        due = time.monotonic()
+        while not self.stop_event.is_set():
+            yield self.source.frame(size, quality)
+            due += interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                # Like the real camera, skip frames rather than catch up
+                due = time.monotonic()
+
+    def _write_chunks(self, output, frame):
+        # picamera hands outputs bytes, which they may rely on
+        for start in range(0, len(frame), self.chunk_size):
+            output.write(frame[start:start + self.chunk_size])
+
+    def _record(self, output, size, quality):
+        try:
+            for frame in self._frames(size, quality):
+                self._write_chunks(output, frame)
+        except Exception as e:
+            # Raised by the next wait_recording, as picamera does
+            self.error = e
+
+    def start_recording(self, output, format='mjpeg', quality=None,
+                        resize=None, **options):
+        if format != 'mjpeg':
+            raise ValueError('FakePiCamera only records mjpeg, not %s' % format)
+        if self.recording is not None:
+            raise RuntimeError('Already recording')
+        size = parse_resolution(resize) if resize else self._resolution
+        self.stop_event.clear()
+        self.error = None
+        self.output = output
+        self.recording = threading.Thread(
+            target=self._record, args=(output, size, quality or 85),
+            daemon=True)
+        self.recording.start()
+
+    def wait_recording(self, timeout=0, **options):
+        if self.recording is None:
+            raise PiCameraNotRecording('There is no recording in progress')
+        self.recording.join(timeout)
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def stop_recording(self, **options):
+        if self.recording is None:
+            raise PiCameraNotRecording('There is no recording in progress')
+        self.stop_event.set()
+        self.recording.join()
+        self.recording = None
+        if hasattr(self.output, 'flush'):
+            self.output.flush()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def capture_continuous(self, output, format='jpeg', use_video_port=False,
+                           resize=None, quality=85, **options):
+        if format != 'jpeg':
+            raise ValueError('FakePiCamera only captures jpeg, not %s' % format)
+        size = parse_resolution(resize) if resize else self._resolution
+        self.stop_event.clear()
+        for frame in self._frames(size, quality):
+            output.write(frame)
+            yield output
+
+    def capture_sequence(self, outputs, format='jpeg', use_video_port=False,
+                         resize=None, quality=85, **options):
+        if format != 'jpeg':
+            raise ValueError('FakePiCamera only captures jpeg, not %s' % format)
+        size = parse_resolution(resize) if resize else self._resolution
+        self.stop_event.clear()
+        # Take each output before its frame, as picamera does, so a generator
+        # of outputs can tell when the previous capture has finished
+        for output, frame in zip(outputs, self._frames(size, quality)):
+            output.write(frame)
+
+
+def open_camera(fake=None, **options):
+    """Return a FakePiCamera if fake is set, else a real picamera.PiCamera.
+
+    fake is 'pattern' for test patterns or the path of an MJPEG file to
+    replay, as given to --fake-camera (see add_camera_argument). picamera is
+    only imported when a real camera is wanted.
+    """
+    if fake:
+        return FakePiCamera(
+            source=None if fake == 'pattern' else fake, **options)
+    import picamera
+    return picamera.PiCamera(**options)
+
+
+def add_camera_argument(parser):
+    parser.add_argument(
+        '--fake-camera', nargs='?', const='pattern', metavar='MJPEG_FILE',
+        help='use generated test patterns, or frames from an MJPEG file, '
+             'instead of the Pi camera')
@@ -0,0 +1,144 @@
+import collections
+import select
+import struct
+import time
+
+# Version 1: every frame is a 32-bit little-endian length and the JPEG data.
+# Version 2 adds a header starting with MAGIC, which as a version 1 length
+# would be an ~800MB frame, so receivers can tell the two apart per frame:
+#   magic, sequence number, capture time, send time (time.time() on the
+#   sender), then the same 32-bit length
+V1_HEADER = struct.Struct('<L')
+V2_HEADER = struct.Struct('<4sLddL')
+MAGIC = b'FRM2'
+# A zero version 1 length ends the stream whichever version is in use
+END_OF_STREAM = V1_HEADER.pack(0)
+# A consumer of stream_relay.py can choose how it drops frames by offering
+# one of these instead of MAGIC; either way it gets version 2
+POLICY_OFFERS = {b'FRML': 'latest', b'FRME': 'every'}
+# how long a sender waits for the receiver to offer version 2
+OFFER_TIMEOUT = 1.0
+# frames the latency percentiles are taken over
+WINDOW = 300
+
+
+def offer_v2(sock, policy=None):
+    """Receiver side: tell a newly connected sender we understand version 2.
+
+    Senders that predate version 2 never read from the socket, so the offer
+    just sits unread in their receive buffer. policy, 'latest' or 'every',
+    asks a relay for that drop policy (see POLICY_OFFERS).
+    """
+    if policy is None:
+        sock.sendall(MAGIC)
+        return
+    for offer, offered_policy in POLICY_OFFERS.items():
+        if offered_policy == policy:
+            sock.sendall(offer)
+            return
+    raise ValueError('Unknown drop policy %s' % policy)
+
+
+def negotiate_version(sock, timeout=OFFER_TIMEOUT):
+    """Sender side: return 2 if the receiver offered version 2, else 1."""
+    offer = b''
+    deadline = time.monotonic() + timeout
+    while len(offer) < len(MAGIC):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+            return 1
+        data = sock.recv(len(MAGIC) - len(offer))
+        if not data:
+            return 1
+        offer += data
+    return 2 if offer == MAGIC else 1
+
+
+def frame_header(version, length, sequence=0, capture_time=None):
+    """Return the header to send before a frame of length bytes."""
+    if version < 2:
+        return V1_HEADER.pack(length)
+    send_time = time.time()
+    if capture_time is None:
+        capture_time = send_time
+    return V2_HEADER.pack(
+        MAGIC, sequence & 0xFFFFFFFF, capture_time, send_time, length)
+
+
+class FrameWriter(object):
+    """Write frames to a file-like connection in the negotiated format."""
+
+    def __init__(self, connection, version=2):
+        self.connection = connection
+        self.version = version
+        self.sequence = 0
+
+    def write_frame(self, data, capture_time=None, sequence=None):
+        """Send one frame.
+
+        Pass the capture sequence number if frames may be dropped before they
+        get here, so the receiver sees the gap.
+        """
+        self.sequence = self.sequence + 1 if sequence is None else sequence
+        self.connection.write(
+            frame_header(self.version, len(data), self.sequence, capture_time))
+        self.connection.write(data)
+        # Don't leave the tail of the frame buffered until the next one
+        self.connection.flush()
+
+    def end(self):
+        self.connection.write(END_OF_STREAM)
+        self.connection.flush()
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyStats(object):
+    """Rolling latency, drop and jitter figures for version 2 frames.
+
+    Latency is capture to receipt and transit is send to receipt, both from
+    timestamps taken on the sender, so they are only meaningful if the two
+    hosts' clocks are synchronised (e.g. NTP). Jitter is the RFC 3550
+    interarrival jitter, which only depends on differences between frames and
+    so does not need synchronised clocks.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.latencies = collections.deque(maxlen=window)
+        self.transits = collections.deque(maxlen=window)
+        self.frames = 0
+        self.dropped = 0
+        self.jitter = 0.0
+        self.last = None  # (sequence, send time, receive time)
+
+    def add(self, sequence, capture_time, send_time, receive_time):
+        self.frames += 1
+        self.latencies.append(receive_time - capture_time)
+        self.transits.append(receive_time - send_time)
+        if self.last is not None:
+            last_sequence, last_send, last_receive = self.last
+            gap = (sequence - last_sequence) & 0xFFFFFFFF
+            if 1 < gap < 0x80000000:
+                self.dropped += gap - 1
+            delta = (receive_time - last_receive) - (send_time - last_send)
+            self.jitter += (abs(delta) - self.jitter) / 16
+        self.last = (sequence, send_time, receive_time)
+
+    def snapshot(self):
+        """Return the current figures as a dict, times in milliseconds."""
+        stats = {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'jitter_ms': self.jitter * 1000,
+        }
+        for name, values in (('latency', self.latencies),
+                             ('transit', self.transits)):
+            if values:
+                ordered = sorted(values)
+                for label, fraction in (('p50', 0.5), ('p90', 0.9),
+                                        ('p99', 0.99)):
+                    stats['%s_%s_ms' % (name, label)] = (
+                        percentile(ordered, fraction) * 1000)
+        return stats
@@ -0,0 +1,93 @@
+import time
+from frame_protocol import (
+    MAGIC, V1_HEADER, V2_HEADER, LatencyStats, offer_v2)
+
+INITIAL_SIZE = 256 * 1024
+
+
+class FrameReceiver(object):
+    """Receive length-prefixed frames into one reusable buffer.
+
+    Each frame is sent as a header followed by that many bytes of image data;
+    a zero length ends the stream. The header is either a bare 32-bit
+    little-endian length (version 1) or a version 2 header carrying a
+    sequence number and timestamps (see frame_protocol), told apart frame by
+    frame. Unless offer is False, the sender is told on connection that we
+    accept version 2, asking for the given drop policy if this is a relay
+    (see offer_v2); latency, drop and jitter figures for version 2 frames
+    are kept in stats.
+
+    Headers and frames are read with recv_into straight into preallocated
+    buffers, and frames are returned as memoryviews onto the frame buffer, so
+    receiving a frame allocates and copies nothing. The buffer only grows
+    when a frame bigger than any before it arrives.
+
+    A frame view is only valid until the next frame is received.
+    """
+
+    def __init__(self, sock, size=INITIAL_SIZE, offer=True, policy=None):
+        self.sock = sock
+        self.header = bytearray(V2_HEADER.size)
+        self.buffer = bytearray(size)
+        self.frames = 0
+        self.bytes_received = 0
+        self.stats = LatencyStats()
+        # Details of the last frame received; for version 1 frames the
+        # sequence is our own count and the times are None
+        self.version = None
+        self.sequence = 0
+        self.capture_time = None
+        self.send_time = None
+        if offer:
+            offer_v2(sock, policy)
+
+    def _recv_exactly(self, view):
+        received = 0
+        while received < len(view):
+            n = self.sock.recv_into(view[received:])
+            if not n:
+                raise EOFError(
+                    'connection closed after %d of %d bytes' % (
+                        received, len(view)))
+            received += n
+
+    def _receive_header(self):
+        """Read the next header and return the frame length."""
+        header = memoryview(self.header)
+        self._recv_exactly(header[:V1_HEADER.size])
+        if self.header[:len(MAGIC)] != MAGIC:
+            self.version = 1
+            self.sequence += 1
+            return V1_HEADER.unpack_from(self.header)[0]
+        self._recv_exactly(header[V1_HEADER.size:])
+        (magic, self.sequence, self.capture_time, self.send_time,
+         length) = V2_HEADER.unpack(self.header)
+        self.version = 2
+        return length
+
+    def receive(self):
+        """Return a memoryview of the next frame, or None at end of stream."""
+        try:
+            length = self._receive_header()
+        except EOFError:
+            # The sender went away between frames
+            return None
+        if not length:
+            return None
+        if length > len(self.buffer):
+            self.buffer = bytearray(length)
+        frame = memoryview(self.buffer)[:length]
+        self._recv_exactly(frame)
+        self.frames += 1
+        self.bytes_received += length
+        if self.version == 2:
+            self.stats.add(
+                self.sequence, self.capture_time, self.send_time, time.time())
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return
+            yield frame
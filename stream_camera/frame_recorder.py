@@ -0,0 +1,215 @@
+"""Record frames into rotating segment files and play them back by time.
+
+Each segment is a plain MJPEG file (the JPEG frames back to back) named
+after the millisecond timestamp of its first frame, next to an index file of
+fixed-size records giving each frame's offset, size and timestamp. Playback
+memory-maps both, so finding the frame at a given time is a binary search
+over the segment names and then over one index, without reading any frames.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+# offset in the segment, size, timestamp (time.time())
+INDEX_RECORD = struct.Struct('<QLd')
+SEGMENT_SECONDS = 60.0
+
+
+def segment_name(timestamp):
+    return '%013d' % int(timestamp * 1000)
+
+
+class FrameRecorder(object):
+    """Append frames to the current segment, starting a new one as needed.
+
+    Frames must be written in time order. Both files are flushed after every
+    frame, so a crash loses at most the frame being written and a player can
+    follow a recording in progress.
+    """
+
+    def __init__(self, directory, segment_seconds=SEGMENT_SECONDS):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.data = None
+        self.index = None
+        self.segment_start = None
+        self.frames = 0
+        self.dropped = 0
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _start_segment(self, timestamp):
+        self.close()
+        base = os.path.join(self.directory, segment_name(timestamp))
+        self.data = open(base + '.mjpg', 'wb')
+        self.index = open(base + '.idx', 'wb')
+        self.segment_start = timestamp
+
+    def write_frame(self, data, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if (self.data is None or
+                timestamp - self.segment_start >= self.segment_seconds):
+            self._start_segment(timestamp)
+        offset = self.data.tell()
+        self.data.write(data)
+        self.data.flush()
+        self.index.write(INDEX_RECORD.pack(offset, len(data), timestamp))
+        self.index.flush()
+        self.frames += 1
+
+    def close(self):
+        for f in (self.data, self.index):
+            if f is not None:
+                f.close()
+        self.data = self.index = None
+
+    def follow(self, ring, stop=None):
+        """Record every frame committed to a FrameRing, on a new thread.
+
+        The camera thread is never held up by the disk: if recording falls so
+        far behind that a frame's slot is reused before it is saved, that
+        frame is dropped.
+        """
+        self.thread = threading.Thread(
+            target=self._follow, args=(ring, stop or threading.Event()),
+            daemon=True)
+        self.thread.start()
+
+    def _follow(self, ring, stop):
+        sequence = ring.sequence
+        while not stop.is_set():
+            wanted, frame = ring.get_frame_after(sequence, timeout=1.0)
+            if frame is None:
+                continue
+            # Copy before checking, so the frame can't change under us
+            data = bytes(frame)
+            if sequence and wanted > sequence + 1:
+                self.dropped += wanted - sequence - 1
+            sequence = wanted
+            if not ring.is_current(wanted):
+                self.dropped += 1
+                continue
+            self.write_frame(data, ring.capture_time(wanted))
+        self.close()
+
+
+class IndexTimes(object):
+    """The timestamps of a memory-mapped index, as a sequence for bisect."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index) // INDEX_RECORD.size
+
+    def __getitem__(self, i):
+        return INDEX_RECORD.unpack_from(self.index, i * INDEX_RECORD.size)[2]
+
+
+class Segment(object):
+    def __init__(self, base):
+        self.base = base
+        self.start = int(os.path.basename(base)) / 1000.0
+        # Map the index first: frames are written before their index records,
+        # so every frame indexed is in the data when it is mapped
+        with open(base + '.idx', 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(base + '.mjpg', 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.times = IndexTimes(self.index)
+
+    def __len__(self):
+        # A record is only written once its frame is complete
+        return len(self.times)
+
+    def frame(self, i):
+        """Return (timestamp, frame), the frame as a view of the mapping."""
+        offset, size, timestamp = INDEX_RECORD.unpack_from(
+            self.index, i * INDEX_RECORD.size)
+        return timestamp, memoryview(self.data)[offset:offset + size]
+
+    def find(self, timestamp):
+        """Index of the first frame at or after timestamp."""
+        return bisect.bisect_left(self.times, timestamp)
+
+    def close(self):
+        self.index.close()
+        self.data.close()
+
+
+class FramePlayer(object):
+    """Seek and play through the segments of a recording directory."""
+
+    def __init__(self, directory):
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            base, ext = os.path.splitext(os.path.join(directory, name))
+            # Empty files can't be mapped
+            if (ext == '.idx' and os.path.getsize(base + '.idx') and
+                    os.path.getsize(base + '.mjpg')):
+                self.segments.append(Segment(base))
+        self.starts = [segment.start for segment in self.segments]
+
+    def seek(self, timestamp):
+        """Find the first frame at or after timestamp.
+
+        Returns (segment number, frame number), or None if the recording ends
+        before timestamp.
+        """
+        number = max(0, bisect.bisect_right(self.starts, timestamp) - 1)
+        for number in range(number, len(self.segments)):
+            i = self.segments[number].find(timestamp)
+            if i < len(self.segments[number]):
+                return number, i
+        return None
+
+    def frames(self, start=0.0, end=float('inf')):
+        """Yield (timestamp, frame) from start until end."""
+        position = self.seek(start)
+        if position is None:
+            return
+        number, i = position
+        for segment in self.segments[number:]:
+            for j in range(i, len(segment)):
+                timestamp, frame = segment.frame(j)
+                if timestamp >= end:
+                    return
+                yield timestamp, frame
+            i = 0
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('directory')
+    parser.add_argument(
+        '--at', type=float, help='save the frame at this time.time() value')
+    parser.add_argument('--out', default='frame.jpg')
+    args = parser.parse_args()
+
+    player = FramePlayer(args.directory)
+    for segment in player.segments:
+        if len(segment):
+            print('%s: %d frames, %s to %s' % (
+                segment.base, len(segment),
+                time.ctime(segment.frame(0)[0]),
+                time.ctime(segment.frame(len(segment) - 1)[0])))
+    position = None if args.at is None else player.seek(args.at)
+    if position is not None:
+        number, i = position
+        timestamp, frame = player.segments[number].frame(i)
+        with open(args.out, 'wb') as f:
+            f.write(frame)
+        # The mapping can't be closed while a view of it exists
+        frame.release()
+        print('Saved frame from %s to %s' % (time.ctime(timestamp), args.out))
+    player.close()
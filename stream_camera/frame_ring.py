@@ -0,0 +1,268 @@
+import time
+from threading import Condition
+
+SLOTS = 4
+SLOT_SIZE = 128 * 1024
+# clients still sending a frame this long after it was captured are dropped
+MAX_LAG = 2.0
+
+
+class ClientTooSlow(Exception):
+    """Raised when a client has fallen too far behind the live stream."""
+    pass
+
+
+class FrameRing(object):
+    """Preallocated ring of frame slots, each tagged with a sequence number.
+
+    A frame is copied once, chunk by chunk, into the next slot as the encoder
+    produces it, then published with commit(). Readers get memoryviews onto
+    the slot, so any number of them can send the frame without copying it.
+    A slot is only reused SLOTS - 1 frames later; readers that fall further
+    behind than that must skip ahead (see is_current).
+    """
+
+    def __init__(self, slots=SLOTS, slot_size=SLOT_SIZE):
+        self.slots = [bytearray(slot_size) for i in range(slots)]
+        self.lengths = [0] * slots
+        self.commit_times = [0.0] * slots  # time.monotonic() of each commit
+        # time.time() each frame was captured, where the writer knows it
+        self.capture_times = [0.0] * slots
+        self.sequence = 0  # sequence number of the newest complete frame
+        self.write_pos = 0  # bytes written to the frame in progress
+        self.condition = Condition()
+        # called with the new sequence number after each commit, from the
+        # writer's thread
+        self.listeners = []
+        # (sequence, bytes) of the newest frame copied by snapshot()
+        self._snapshot = (0, None)
+
+    def _slot_index(self, sequence):
+        return sequence % len(self.slots)
+
+    def write(self, buf):
+        """Append a chunk of the frame in progress to its slot."""
+        index = self._slot_index(self.sequence + 1)
+        slot = self.slots[index]
+        end = self.write_pos + len(buf)
+        if end > len(slot):
+            # Grow by replacing the slot; readers still holding views of the
+            # old buffer keep it alive until they are done with it
+            grown = bytearray(max(end, 2 * len(slot)))
+            grown[:self.write_pos] = memoryview(slot)[:self.write_pos]
+            self.slots[index] = slot = grown
+        slot[self.write_pos:end] = buf
+        self.write_pos = end
+        return len(buf)
+
+    def pending(self):
+        """Return a view of the frame written so far but not committed."""
+        index = self._slot_index(self.sequence + 1)
+        return memoryview(self.slots[index])[:self.write_pos]
+
+    def discard(self):
+        """Throw away the frame in progress instead of committing it."""
+        self.write_pos = 0
+
+    def commit(self, capture_time=None):
+        """Publish the frame in progress and wake waiting readers."""
+        if not self.write_pos:
+            return self.sequence
+        with self.condition:
+            self.sequence += 1
+            index = self._slot_index(self.sequence)
+            self.lengths[index] = self.write_pos
+            self.commit_times[index] = time.monotonic()
+            self.capture_times[index] = (
+                time.time() if capture_time is None else capture_time)
+            self.write_pos = 0
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(self.sequence)
+        return self.sequence
+
+    def is_current(self, sequence):
+        """True while the frame with this sequence number has not been reused."""
+        return 0 < sequence and self.sequence - sequence < len(self.slots) - 1
+
+    def view(self, sequence):
+        index = self._slot_index(sequence)
+        return memoryview(self.slots[index])[:self.lengths[index]]
+
+    def commit_time(self, sequence):
+        return self.commit_times[self._slot_index(sequence)]
+
+    def capture_time(self, sequence):
+        return self.capture_times[self._slot_index(sequence)]
+
+    def latest(self):
+        """Return (sequence, frame) for the newest frame, or (0, None)."""
+        with self.condition:
+            if not self.sequence:
+                return 0, None
+            return self.sequence, self.view(self.sequence)
+
+    def snapshot(self):
+        """Return (sequence, copy of the newest frame), or (0, None).
+
+        Unlike latest(), the frame is copied, so it stays valid however long
+        it takes to send. The copy is made once per frame and shared by every
+        caller until a newer frame is committed.
+        """
+        # Read once: another thread may replace it (the tuple, never its parts)
+        cached = self._snapshot
+        if cached[0] == self.sequence:
+            return cached
+        while True:
+            sequence, frame = self.latest()
+            if frame is None:
+                return 0, None
+            data = bytes(frame)
+            if self.is_current(sequence):
+                self._snapshot = (sequence, data)
+                return sequence, data
+
+    def stats(self):
+        """Frame rate and sizes over the frames the ring holds."""
+        with self.condition:
+            oldest = max(1, self.sequence - len(self.slots) + 2)
+            held = range(self.sequence, oldest - 1, -1)
+            sizes = [self.lengths[self._slot_index(s)] for s in held]
+            times = [self.commit_times[self._slot_index(s)] for s in held]
+        fps = 0.0
+        if len(times) > 1 and times[0] > times[-1]:
+            fps = (len(times) - 1) / (times[0] - times[-1])
+        return {
+            'frames': self.sequence,
+            'fps': round(fps, 2),
+            'frame_bytes': {
+                'last': sizes[0] if sizes else 0,
+                'mean': sum(sizes) // len(sizes) if sizes else 0,
+                'max': max(sizes) if sizes else 0,
+            },
+        }
+
+    def get_frame_after(self, sequence, timeout=None):
+        """Wait for the frame after sequence and return (sequence, frame).
+
+        If that frame has already been reused, the oldest frame still held is
+        returned instead. Returns (sequence, None) on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.sequence > sequence, timeout):
+                return sequence, None
+            wanted = sequence + 1
+            if not self.is_current(wanted):
+                wanted = self.sequence - len(self.slots) + 2
+            return wanted, self.view(wanted)
+
+    def get_latest_frame_after(self, sequence, timeout=None):
+        """Wait for a frame newer than sequence and return the newest one.
+
+        Returns (sequence, frame), or (sequence, None) on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.sequence > sequence, timeout):
+                return sequence, None
+            return self.sequence, self.view(self.sequence)
+
+
+class ClientDelivery(object):
+    """Latest-frame-wins delivery state for one streaming client.
+
+    Each time the client is ready for another frame it skips straight to the
+    newest one, counting the frames it skipped as dropped, so a slow client
+    shows stale frames less often rather than falling further behind. A
+    client that takes longer than max_lag to finish sending a frame is cut
+    off. The ring needs enough slots to hold max_lag worth of frames, or
+    slow clients will be cut off sooner because their slot was reused.
+    """
+
+    def __init__(self, ring, address, max_lag=MAX_LAG):
+        self.ring = ring
+        self.address = address
+        self.max_lag = max_lag
+        self.sequence = ring.sequence
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.lag = 0.0  # capture to end of send, for the last frame sent
+
+    def stats(self):
+        return {
+            'address': '%s:%s' % tuple(self.address[:2]),
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'bytes_sent': self.bytes_sent,
+            'lag': round(self.lag, 3),
+        }
+
+    def take_latest(self):
+        """Return the newest frame if there is one we haven't sent, else None."""
+        sequence, frame = self.ring.latest()
+        if sequence <= self.sequence:
+            return None
+        if self.sent:
+            self.dropped += sequence - self.sequence - 1
+        self.sequence = sequence
+        return frame
+
+    def take_next(self):
+        """Return the frame after the last one sent, or None if there is none.
+
+        For clients that want every frame: if that frame has already been
+        reused, the oldest frame still held is returned instead and the ones
+        in between are counted as dropped.
+        """
+        last = self.sequence
+        sequence, frame = self.ring.get_frame_after(last, 0)
+        if frame is None:
+            return None
+        if self.sent:
+            self.dropped += sequence - last - 1
+        self.sequence = sequence
+        return frame
+
+    def next_frame(self, timeout=None):
+        """Wait for and return the newest frame, or None on timeout."""
+        last = self.sequence
+        self.sequence, frame = self.ring.get_latest_frame_after(last, timeout)
+        if frame is not None and self.sent:
+            self.dropped += self.sequence - last - 1
+        return frame
+
+    def check_current(self):
+        """Raise ClientTooSlow if the frame being sent has been overwritten."""
+        if not self.ring.is_current(self.sequence):
+            # The slot was refilled while we were still sending from it
+            raise ClientTooSlow(
+                'frame %d was overwritten while sending' % self.sequence)
+
+    def frame_sent(self, size):
+        """Record a finished send; raises ClientTooSlow if it lagged too far."""
+        self.check_current()
+        self.sent += 1
+        self.bytes_sent += size
+        self.lag = time.monotonic() - self.ring.commit_time(self.sequence)
+        if self.lag > self.max_lag:
+            raise ClientTooSlow(
+                'frame %d finished sending %.2fs after capture' % (
+                    self.sequence, self.lag))
+
+
+def stream_stats(ring, clients, gate=None):
+    """Stats for a ring and the clients streaming from it, as a dict."""
+    stats = ring.stats()
+    # Other threads add and remove clients as we go
+    clients = clients.copy()
+    stats['clients'] = [client.stats() for client in clients]
+    stats['dropped'] = sum(client.dropped for client in clients)
+    if gate is not None:
+        stats['motion_gate'] = {
+            'frames': gate.frames,
+            'frames_sent': gate.frames_sent,
+            'bytes_saved': gate.bytes_saved,
+        }
+    return stats
@@ -0,0 +1,94 @@
+import io
+import time
+import numpy as np
+from PIL import Image
+
+# fraction of blocks that must change for a frame to count as motion
+THRESHOLD = 0.02
+# seconds between frames sent when nothing moves, so viewers know we're alive
+KEEPALIVE = 5.0
+# JPEG decoding can scale down by up to 8 for almost nothing
+SCALE = 8
+# side of the blocks compared, in pixels of the downscaled image
+BLOCK = 4
+# change in a block's mean grey level that counts as the block changing
+BLOCK_DELTA = 8.0
+
+
+class MotionGate(object):
+    """Skip frames that barely differ from the last one sent.
+
+    Each frame is decoded to greyscale at 1/SCALE size, which JPEG allows
+    without doing the full decode, and the mean of every BLOCK x BLOCK block
+    compared with the same block in the last frame sent. A frame is sent if
+    more than threshold of its blocks changed by BLOCK_DELTA grey levels, or
+    if nothing has been sent for keepalive seconds. Comparing against the
+    last frame sent rather than the previous frame means slow changes still
+    get through once they add up.
+    """
+
+    def __init__(self, threshold=THRESHOLD, keepalive=KEEPALIVE):
+        self.threshold = threshold
+        self.keepalive = keepalive
+        self.reference = None
+        self.last_sent = 0.0
+        self.score = 0.0
+        self.frames = 0
+        self.frames_sent = 0
+        self.bytes = 0
+        self.bytes_sent = 0
+
+    def blocks(self, data):
+        image = Image.open(io.BytesIO(data))
+        image.draft('L', (image.width // SCALE, image.height // SCALE))
+        grey = np.asarray(image.convert('L'), dtype=np.float32)
+        height = grey.shape[0] - grey.shape[0] % BLOCK
+        width = grey.shape[1] - grey.shape[1] % BLOCK
+        return grey[:height, :width].reshape(
+            height // BLOCK, BLOCK, width // BLOCK, BLOCK).mean(axis=(1, 3))
+
+    def should_send(self, data):
+        """Decide whether to send this JPEG frame, updating the counters."""
+        blocks = self.blocks(data)
+        now = time.monotonic()
+        if self.reference is None or self.reference.shape != blocks.shape:
+            # First frame, or the resolution changed
+            self.score = 1.0
+        else:
+            self.score = float(np.mean(
+                np.abs(blocks - self.reference) > BLOCK_DELTA))
+        self.frames += 1
+        self.bytes += len(data)
+        if (self.score < self.threshold and
+                now - self.last_sent < self.keepalive):
+            return False
+        self.reference = blocks
+        self.last_sent = now
+        self.frames_sent += 1
+        self.bytes_sent += len(data)
+        return True
+
+    @property
+    def bytes_saved(self):
+        return self.bytes - self.bytes_sent
+
+    def report(self):
+        saved = 100.0 * self.bytes_saved / self.bytes if self.bytes else 0.0
+        return 'Motion gate: sent %d of %d frames, saved %d kB (%.0f%%)' % (
+            self.frames_sent, self.frames, self.bytes_saved / 1000, saved)
+
+
+def add_gate_arguments(parser):
+    parser.add_argument(
+        '--motion-threshold', type=float, metavar='FRACTION',
+        help='only send frames where at least this fraction of the picture '
+             'changed (e.g. %g)' % THRESHOLD)
+    parser.add_argument(
+        '--keepalive', type=float, default=KEEPALIVE, metavar='SECONDS',
+        help='with --motion-threshold, send a frame at least this often')
+
+
+def gate_from_arguments(args):
+    if args.motion_threshold is None:
+        return None
+    return MotionGate(args.motion_threshold, args.keepalive)
@@ -0,0 +1,206 @@
+"""A frame ring in shared memory, for consumers on the same machine.
+
+The writer copies each frame once into the next slot of a
+multiprocessing.shared_memory block; any number of reader processes attach
+to the block by name and get memoryviews straight onto the slots, without
+sockets, HTTP framing or copies.
+
+Layout: a header (magic, slot count, slot size, sequence number of the
+newest frame) followed by the slots, each a slot header and the frame data.
+Each slot is guarded like a seqlock: the writer stores the new frame's
+sequence number in the slot's 'begin' field before touching the data and in
+'end' once it is complete, so a reader holding frame n knows it is still
+intact while 'begin' is still n.
+"""
+
+import argparse
+import struct
+import time
+from multiprocessing import shared_memory
+
+MAGIC = b'FRNG'
+HEADER = struct.Struct('<4sLLQ')  # magic, slots, slot size, newest sequence
+SLOT_HEADER = struct.Struct('<QQLd')  # begin, end, length, capture time
+SEQUENCE_OFFSET = 12
+SLOTS = 8
+SLOT_SIZE = 512 * 1024
+# readers poll for new frames this soon after the last one, backing off to
+# MAX_POLL_INTERVAL while none come
+POLL_INTERVAL = 0.002
+MAX_POLL_INTERVAL = 0.01
+
+
+class ShmFrameWriter(object):
+    """Create a shared memory ring and publish frames into it."""
+
+    def __init__(self, name, slots=SLOTS, slot_size=SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        size = HEADER.size + slots * (SLOT_HEADER.size + slot_size)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.sequence = 0
+        self.oversize = 0  # frames too big for a slot, not published
+        HEADER.pack_into(self.buf, 0, MAGIC, slots, slot_size, 0)
+
+    def publish(self, frame, capture_time=None):
+        """Copy a complete frame into the next slot and announce it."""
+        if len(frame) > self.slot_size:
+            self.oversize += 1
+            return self.sequence
+        sequence = self.sequence + 1
+        offset = HEADER.size + (sequence % self.slots) * (
+            SLOT_HEADER.size + self.slot_size)
+        data = offset + SLOT_HEADER.size
+        # begin first, so readers of the frame this slot held see it's gone
+        struct.pack_into('<Q', self.buf, offset, sequence)
+        self.buf[data:data + len(frame)] = frame
+        SLOT_HEADER.pack_into(
+            self.buf, offset, sequence, sequence, len(frame),
+            time.time() if capture_time is None else capture_time)
+        struct.pack_into('<Q', self.buf, SEQUENCE_OFFSET, sequence)
+        self.sequence = sequence
+        return sequence
+
+    def follow(self, ring):
+        """Publish every frame committed to a FrameRing from now on."""
+        def frame_committed(sequence):
+            # Called on the writer's thread straight after the commit, so the
+            # slot can't have been reused yet
+            frame = ring.view(sequence)
+            self.publish(frame, ring.capture_time(sequence))
+            frame.release()
+        ring.listeners.append(frame_committed)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ShmFrameReader(object):
+    """Attach to a ShmFrameWriter's ring and read frames from it.
+
+    Frames are memoryviews onto shared memory, valid until the writer comes
+    round to their slot again; check is_current() after using one to be
+    sure it wasn't overwritten meanwhile, and release() every view before
+    close().
+    """
+
+    def __init__(self, name):
+        try:
+            # Python 3.13+: don't let our exit destroy the writer's block
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name)
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.buf = self.shm.buf
+        magic, self.slots, self.slot_size, _ = HEADER.unpack_from(self.buf)
+        if magic != MAGIC:
+            raise ValueError('%s is not a frame ring' % name)
+        self.dropped = 0
+
+    @property
+    def sequence(self):
+        """Sequence number of the newest frame."""
+        return struct.unpack_from('<Q', self.buf, SEQUENCE_OFFSET)[0]
+
+    def _slot(self, sequence):
+        return HEADER.size + (sequence % self.slots) * (
+            SLOT_HEADER.size + self.slot_size)
+
+    def is_current(self, sequence):
+        """True while frame sequence has not been overwritten."""
+        begin = struct.unpack_from('<Q', self.buf, self._slot(sequence))[0]
+        return begin == sequence
+
+    def frame(self, sequence):
+        """Return (capture time, view) of a frame.
+
+        Returns (None, None) if its slot no longer holds it, or doesn't yet.
+        """
+        offset = self._slot(sequence)
+        begin, end, length, capture_time = SLOT_HEADER.unpack_from(
+            self.buf, offset)
+        if begin != sequence or end != sequence:
+            return None, None
+        data = offset + SLOT_HEADER.size
+        return capture_time, self.buf[data:data + length]
+
+    def wait_for_frame(self, after, timeout=None, every=False):
+        """Wait for a frame newer than after; return (sequence, view).
+
+        By default this is the newest frame; with every=True it is the one
+        straight after, or the oldest one still held if that has gone. Frames
+        skipped either way are counted in dropped. Returns (after, None) on
+        timeout.
+
+        There is nothing to block on in shared memory, so this polls: first
+        every POLL_INTERVAL, doubling up to MAX_POLL_INTERVAL while nothing
+        arrives. An idle reader wakes at most 100 times a second, and a frame
+        is picked up at most MAX_POLL_INTERVAL after it is published.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = POLL_INTERVAL
+        while True:
+            newest = self.sequence
+            if newest > after:
+                wanted = newest
+                if every:
+                    wanted = max(after + 1, newest - self.slots + 2)
+                capture_time, view = self.frame(wanted)
+                if view is not None:
+                    if after:
+                        self.dropped += wanted - after - 1
+                    return wanted, view
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return after, None
+            if deadline is not None:
+                interval = min(interval, deadline - now)
+            time.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    def frames(self, every=False):
+        """Yield (sequence, view) for each new frame, forever."""
+        sequence = self.sequence
+        while True:
+            sequence, view = self.wait_for_frame(sequence, every=every)
+            yield sequence, view
+            view.release()
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Read frames from a shared memory ring and report the rate')
+    parser.add_argument('name')
+    parser.add_argument('--every', action='store_true',
+                        help='take every frame rather than the newest')
+    args = parser.parse_args()
+
+    reader = ShmFrameReader(args.name)
+    start = time.monotonic()
+    count = 0
+    try:
+        for sequence, frame in reader.frames(args.every):
+            count += 1
+            if time.monotonic() - start >= 5:
+                print('%.1f fps, frame %d is %d bytes, %d dropped' % (
+                    count / (time.monotonic() - start), sequence, len(frame),
+                    reader.dropped))
+                start = time.monotonic()
+                count = 0
+    except KeyboardInterrupt:
+        pass
@@ -1,46 +1,185 @@
+import argparse
 import io
+import queue
 import socket
-import struct
+import threading
 import time
-import picamera
+from fake_camera import add_camera_argument, open_camera
+from frame_protocol import FrameWriter, negotiate_version
 
-# Connect a client socket to my_server:8000 (change my_server to the
-# hostname of your server)
+# streams captured into while earlier frames are still being sent
+BUFFERS = 4
+# the video port captures at the video frame rate; the still port manages
+# only a few frames a second whatever this is set to
+VIDEO_FPS = 15
+STILL_FPS = 5
+
+
+class CapturePipeline(object):
+    """Feed capture_sequence a pool of streams and send them on another thread.
+
+    outputs() is the generator given to capture_sequence: each time it is
+    asked for the next stream, the previous capture has finished, so that
+    stream is queued for a sender thread and a free one handed back. Capture
+    and sending overlap, and a stream is reused once its frame has been sent.
+    If the network stalls and every stream is waiting to be sent, the oldest
+    waiting frame is dropped and its stream reused, so the camera is never
+    held up. If sending fails, e.g. because the receiver went away, outputs()
+    raises the error, which ends capture_sequence early.
+    """
+
+    def __init__(self, writer, buffers=BUFFERS):
+        self.writer = writer
+        self.free = queue.Queue()
+        for _ in range(buffers):
+            self.free.put(io.BytesIO())
+        self.queue = queue.Queue()
+        self.count = 0  # frames captured
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.error = None  # why the sender thread stopped, if it failed
+        self.sender = threading.Thread(target=self._send, daemon=True)
+        self.sender.start()
+
+    def outputs(self, duration):
+        """Yield streams to capture into until duration seconds have passed."""
+        start = time.time()
+        while True:
+            if self.error is not None:
+                raise self.error
+            stream = self._free_stream()
+            yield stream
+            # The capture has just finished
+            capture_time = time.time()
+            self.count += 1
+            self.queue.put((stream, stream.tell(), capture_time, self.count))
+            if capture_time - start > duration:
+                return
+
+    def _free_stream(self):
+        try:
+            stream = self.free.get_nowait()
+        except queue.Empty:
+            try:
+                stream = self.queue.get_nowait()[0]
+                self.dropped += 1
+            except queue.Empty:
+                # The sender has the only other stream; wait for it
+                stream = self.free.get()
+        stream.seek(0)
+        stream.truncate()
+        return stream
+
+    def _send(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            stream, size, capture_time, sequence = frame
+            try:
+                self.writer.write_frame(
+                    stream.getbuffer()[:size], capture_time, sequence)
+            except OSError as e:
+                # Raised on the capture thread by outputs(); give the stream
+                # back so _free_stream can't wait for it forever
+                self.error = e
+                self.free.put(stream)
+                return
+            self.sent += 1
+            self.bytes_sent += size
+            self.free.put(stream)
+
+    def close(self):
+        """Wait for the queued frames to go out, then end the stream."""
+        self.queue.put(None)
+        self.sender.join()
+        if self.error is not None:
+            raise self.error
+        # Write a length of zero to the stream to signal we're done
+        self.writer.end()
+
+
+def capture_still(camera, writer, duration):
+    """Capture from the still port and send each frame before the next.
+
+    Returns the number of frames captured, all of which were sent.
+    """
+    # Construct a stream to hold image data temporarily (we could write it
+    # directly to connection but in this case we want to find out the size
+    # of each capture first to keep our protocol simple)
+    start = time.time()
+    count = 0
+    stream = io.BytesIO()
+    for foo in camera.capture_continuous(stream, 'jpeg'):
+        # The capture has just finished
+        capture_time = time.time()
+        count += 1
+        # Send the header and image data over the wire
+        writer.write_frame(
+            stream.getbuffer()[:stream.tell()], capture_time, count)
+        # If we've been capturing for long enough, quit
+        if time.time() - start > duration:
+            break
+        # Reset the stream for the next capture
+        stream.seek(0)
+        stream.truncate()
+    writer.end()
+    return count
+
+
+parser = argparse.ArgumentParser(description='Send JPEG captures to a receiver')
+parser.add_argument('--host', default='Walker', help='where the receiver runs')
+parser.add_argument(
+    '--duration', type=float, default=30, metavar='SECONDS',
+    help='how long to capture for')
+parser.add_argument(
+    '--still-port', action='store_true',
+    help='capture one frame at a time from the still port instead of '
+         'pipelining captures from the video port')
+parser.add_argument(
+    '--buffers', type=int, default=BUFFERS,
+    help='streams to capture into while frames are being sent (at least 2)')
+add_camera_argument(parser)
+args = parser.parse_args()
+if args.buffers < 2:
+    # With one stream, the next capture would take it back from the sender
+    parser.error('--buffers must be at least 2')
+
+# Connect a client socket to the server on port 8000
 client_socket = socket.socket()
-client_socket.connect(('Walker', 8000))
+client_socket.connect((args.host, 8000))
+# Use timestamped version 2 headers if the receiver offers them
+version = negotiate_version(client_socket)
 
 # Make a file-like object out of the connection
 connection = client_socket.makefile('wb')
+writer = FrameWriter(connection, version)
 try:
-    camera = picamera.PiCamera()
+    camera = open_camera(args.fake_camera)
     camera.resolution = (640, 480)
-    camera.framerate = 5
+    camera.framerate = STILL_FPS if args.still_port else VIDEO_FPS
     # Start a preview and let the camera warm up for 2 seconds
     camera.start_preview()
     time.sleep(2)
 
-    # Note the start time and construct a stream to hold image data
-    # temporarily (we could write it directly to connection but in this
-    # case we want to find out the size of each capture first to keep
-    # our protocol simple)
     start = time.time()
-    stream = io.BytesIO()
-    for foo in camera.capture_continuous(stream, 'jpeg'):
-        # Write the length of the capture to the stream and flush to
-        # ensure it actually gets sent
-        connection.write(struct.pack('<L', stream.tell()))
-        connection.flush()
-        # Rewind the stream and send the image data over the wire
-        stream.seek(0)
-        connection.write(stream.read())
-        # If we've been capturing for more than 30 seconds, quit
-        if time.time() - start > 30:
-            break
-        # Reset the stream for the next capture
-        stream.seek(0)
-        stream.truncate()
-    # Write a length of zero to the stream to signal we're done
-    connection.write(struct.pack('<L', 0))
+    if args.still_port:
+        count = sent = capture_still(camera, writer, args.duration)
+        dropped = 0
+        captured = time.time()
+    else:
+        pipeline = CapturePipeline(writer, args.buffers)
+        camera.capture_sequence(
+            pipeline.outputs(args.duration), 'jpeg', use_video_port=True)
+        captured = time.time()
+        pipeline.close()
+        count, sent, dropped = pipeline.count, pipeline.sent, pipeline.dropped
 finally:
     connection.close()
     client_socket.close()
+    finish = time.time()
+print('Captured %d images in %d seconds at %.2ffps' % (
+    count, captured-start, count / (captured-start)))
+print('Sent %d images in %d seconds at %.2ffps, dropped %d' % (
+    sent, finish-start, sent / (finish-start), dropped))
@@ -2,16 +2,28 @@
 # Source code from the official PiCamera package
 # http://picamera.readthedocs.io/en/latest/recipes2.html#web-streaming
 
-import io
-import picamera
+import argparse
+import json
 import logging
 import socketserver
-from threading import Condition
+import threading
 from http import server
+from adaptive_quality import AdaptiveQuality, make_levels, restart_recording
+from async_mjpeg_server import (
+    SNAPSHOT_CACHE_CONTROL, AsyncMJPEGServer, etag_matches, snapshot_etag)
+from fake_camera import add_camera_argument, open_camera
+from frame_recorder import FrameRecorder
+from motion_gate import add_gate_arguments, gate_from_arguments
+from frame_ring import ClientDelivery, FrameRing, stream_stats
+from shm_frame_ring import ShmFrameWriter
 
 WIDTH = 480 # 960
 HEIGHT = 320 # 640
 FPS = 10
+MAX_LAG = 2.0 # seconds behind live before a client is disconnected
+CONTROL_INTERVAL = 1.0 # seconds between link measurements
+# the end of each frame is held back until the frame is known to be intact
+FRAME_TAIL = 4096
 
 PAGE="""\
 <html>
@@ -26,21 +38,26 @@ PAGE="""\
 """.format(WIDTH, HEIGHT)
 
 class StreamingOutput(object):
-    def __init__(self):
-        self.frame = None
-        self.buffer = io.BytesIO()
-        self.condition = Condition()
+    def __init__(self, gate=None):
+        # Frames are written straight into preallocated slots of a ring and
+        # handed to clients as memoryviews, so each frame is copied once no
+        # matter how many clients are watching
+        # Enough slots that a frame outlives the slowest client we keep
+        self.ring = FrameRing(slots=int(MAX_LAG * FPS) + 2)
+        self.clients = set()
+        # If given, a MotionGate deciding which frames are worth publishing
+        self.gate = gate
 
     def write(self, buf):
         if buf.startswith(b'\xff\xd8'):
-            # New frame, copy the existing buffer's content and notify all
-            # clients it's available
-            self.buffer.truncate()
-            with self.condition:
-                self.frame = self.buffer.getvalue()
-                self.condition.notify_all()
-            self.buffer.seek(0)
-        return self.buffer.write(buf)
+            # New frame, publish the previous one to all clients
+            frame = self.ring.pending()
+            if self.gate is not None and frame and not self.gate.should_send(frame):
+                self.ring.discard()
+            else:
+                self.ring.commit()
+            frame.release()
+        return self.ring.write(buf)
 
 class StreamingHandler(server.BaseHTTPRequestHandler):
     def do_GET(self):
@@ -62,21 +79,61 @@ class StreamingHandler(server.BaseHTTPRequestHandler):
             self.send_header('Pragma', 'no-cache')
             self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=FRAME')
             self.end_headers()
+            client = ClientDelivery(output.ring, self.client_address, MAX_LAG)
+            output.clients.add(client)
+            # A send blocked for longer than this can never catch up
+            self.connection.settimeout(MAX_LAG)
             try:
                 while True:
-                    with output.condition:
-                        output.condition.wait()
-                        frame = output.frame
+                    frame = client.next_frame()
                     self.wfile.write(b'--FRAME\r\n')
                     self.send_header('Content-Type', 'image/jpeg')
                     self.send_header('Content-Length', len(frame))
                     self.end_headers()
-                    self.wfile.write(frame)
+                    self.wfile.write(frame[:-FRAME_TAIL])
+                    # If the slot was reused while the rest went out, cut the
+                    # client off before the frame is complete, so it is never
+                    # shown a torn one
+                    client.check_current()
+                    self.wfile.write(frame[-FRAME_TAIL:])
                     self.wfile.write(b'\r\n')
+                    client.frame_sent(len(frame))
             except Exception as e:
                 logging.warning(
-                    'Removed streaming client %s: %s',
-                    self.client_address, str(e))
+                    'Removed streaming client %s after %d frames, %d dropped: %s',
+                    self.client_address, client.sent, client.dropped, str(e))
+            finally:
+                output.clients.discard(client)
+        elif self.path == '/snapshot.jpg':
+            # The newest frame, from memory; pollers that already have it
+            # get a 304 without it being touched
+            sequence = output.ring.sequence
+            modified = not (sequence and etag_matches(
+                self.headers.get('If-None-Match'), snapshot_etag(sequence)))
+            if modified:
+                sequence, frame = output.ring.snapshot()
+                if frame is None:
+                    self.send_error(503)
+                    return
+            self.send_response(200 if modified else 304)
+            self.send_header('ETag', snapshot_etag(sequence))
+            self.send_header('Cache-Control', SNAPSHOT_CACHE_CONTROL)
+            if modified:
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', len(frame))
+            self.end_headers()
+            if modified:
+                self.wfile.write(frame)
+        elif self.path == '/stats':
+            content = json.dumps(
+                stream_stats(output.ring, output.clients, output.gate)
+            ).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Content-Length', len(content))
+            self.end_headers()
+            self.wfile.write(content)
         else:
             self.send_error(404)
             self.end_headers()
@@ -85,14 +142,79 @@ class StreamingServer(socketserver.ThreadingMixIn, server.HTTPServer):
     allow_reuse_address = True
     daemon_threads = True
 
-with picamera.PiCamera(resolution='{}x{}'.format(WIDTH, HEIGHT), framerate=FPS) as camera:
-    output = StreamingOutput()
-    #Uncomment the next line to change your Pi's Camera rotation (in degrees)
-    #camera.rotation = 90
-    camera.start_recording(output, format='mjpeg')
-    try:
-        address = ('', 8000)
-        server = StreamingServer(address, StreamingHandler)
-        server.serve_forever()
-    finally:
-        camera.stop_recording()
+def measure_link(clients):
+    """Summarise the streaming clients for AdaptiveQuality.update().
+
+    The slowest client's lag, as a fraction of MAX_LAG, stands in for the
+    send queue fill; frames offered are those each client sent or skipped.
+    """
+    # Other threads add and remove clients as we go
+    clients = clients.copy()
+    fill = max([client.lag for client in clients] + [0.0]) / MAX_LAG
+    sent = sum(client.sent for client in clients)
+    offered = sent + sum(client.dropped for client in clients)
+    return (min(fill, 1.0), offered, sent,
+            sum(client.bytes_sent for client in clients))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream the Pi camera as MJPEG')
+    parser.add_argument(
+        '--server', choices=['threading', 'asyncio'], default='threading',
+        help='one thread per client, or all clients on a single event loop')
+    parser.add_argument(
+        '--fixed-quality', action='store_true',
+        help="don't adapt quality, frame rate and size to the link")
+    parser.add_argument(
+        '--record', metavar='DIRECTORY',
+        help='also record the stream into segment files here')
+    parser.add_argument(
+        '--shm', metavar='NAME',
+        help='also publish frames into a shared memory ring for local '
+             'processes (see shm_frame_ring.py)')
+    add_camera_argument(parser)
+    add_gate_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with open_camera(
+            args.fake_camera, resolution='{}x{}'.format(WIDTH, HEIGHT),
+            framerate=FPS) as camera:
+        output = StreamingOutput(gate_from_arguments(args))
+        levels = make_levels(WIDTH, HEIGHT, FPS)
+        controller = AdaptiveQuality(
+            levels, lambda level: restart_recording(camera, output, level))
+        #Uncomment the next line to change your Pi's Camera rotation (in degrees)
+        #camera.rotation = 90
+        shm = None
+        if args.shm:
+            shm = ShmFrameWriter(args.shm)
+            shm.follow(output.ring)
+        camera.start_recording(output, format='mjpeg', quality=levels[0].quality)
+        if args.record:
+            FrameRecorder(args.record).follow(output.ring)
+        try:
+            address = ('', 8000)
+            if args.server == 'asyncio':
+                server = AsyncMJPEGServer(
+                    output.ring, PAGE, MAX_LAG, output.gate)
+                clients = server.clients
+                thread = threading.Thread(
+                    target=server.serve_forever, args=address, daemon=True)
+            else:
+                server = StreamingServer(address, StreamingHandler)
+                clients = output.clients
+                thread = threading.Thread(
+                    target=server.serve_forever, daemon=True)
+            thread.start()
+            # Serve from the thread while this one watches the camera and,
+            # unless told not to, adapts it to the link
+            while thread.is_alive():
+                camera.wait_recording(CONTROL_INTERVAL)
+                if not args.fixed_quality:
+                    controller.update(*measure_link(clients))
+        finally:
+            camera.stop_recording()
+            if shm is not None:
+                shm.close()
+            if output.gate is not None:
+                logging.info(output.gate.report())
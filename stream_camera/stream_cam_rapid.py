@@ -1,46 +1,177 @@
+import argparse
 import io
+import logging
+import queue
 import socket
-import struct
+import threading
 import time
-import picamera
+from adaptive_quality import AdaptiveQuality, make_levels, restart_recording
+from fake_camera import add_camera_argument, open_camera
+from frame_protocol import FrameWriter, negotiate_version
+from motion_gate import add_gate_arguments, gate_from_arguments
+
+# finished frames waiting to be sent before the oldest is dropped
+QUEUE_SIZE = 4
+# best settings; quality, frame rate and then size are stepped down from
+# these when the link can't keep up
+WIDTH = 640
+HEIGHT = 480
+FPS = 15
+# seconds between link measurements
+CONTROL_INTERVAL = 1.0
 
 class SplitFrames(object):
-    def __init__(self, connection):
-        self.connection = connection
+    """Split the MJPEG stream into frames and send them on another thread.
+
+    write() runs in picamera's encoder callback, so it must never wait on the
+    network. Each finished frame is queued with the stream holding it and a
+    fresh stream is taken from a pool of spares; a sender thread writes the
+    queued frames out and returns their streams to the pool. If the network
+    stalls and the queue fills, the oldest frame is dropped. If sending fails,
+    e.g. because the receiver went away, the next write() raises the error,
+    which stops the recording and is raised again by wait_recording.
+    """
+
+    def __init__(self, writer, queue_size=QUEUE_SIZE, gate=None):
+        self.writer = writer
+        # If given, a MotionGate deciding which frames are worth sending
+        self.gate = gate
         self.stream = io.BytesIO()
-        self.count = 0
+        self.capture_time = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.spares = queue.Queue()
+        self.captured = 0  # frames finished by the encoder
+        self.count = 0  # frames queued for sending
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.error = None  # why the sender thread stopped, if it failed
+        self.sender = threading.Thread(target=self._send, daemon=True)
+        self.sender.start()
 
     def write(self, buf):
+        if self.error is not None:
+            raise self.error
         if buf.startswith(b'\xff\xd8'):
-            # Start of new frame; send the old one's length
-            # then the data
+            # Start of new frame; queue the old one for sending
             size = self.stream.tell()
             if size > 0:
-                self.connection.write(struct.pack('<L', size))
-                self.connection.flush()
+                self.captured += 1
+            if size > 0 and self.gate is not None and not self.gate.should_send(
+                    self.stream.getbuffer()[:size]):
+                # Nothing worth sending; reuse the stream for the next frame
                 self.stream.seek(0)
-                self.connection.write(self.stream.read(size))
+            elif size > 0:
                 self.count += 1
-                self.stream.seek(0)
+                self._enqueue(
+                    (self.stream, size, self.capture_time, self.count))
+                self.stream = self._spare_stream()
+            # The encoder hands us a frame's first chunk as soon as it has it
+            self.capture_time = time.time()
         self.stream.write(buf)
 
+    def _spare_stream(self):
+        try:
+            stream = self.spares.get_nowait()
+        except queue.Empty:
+            return io.BytesIO()
+        stream.seek(0)
+        return stream
+
+    def _enqueue(self, frame):
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                pass
+            try:
+                stale = self.queue.get_nowait()
+            except queue.Empty:
+                continue
+            self.spares.put(stale[0])
+            self.dropped += 1
+
+    def _send(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    break
+                stream, size, capture_time, sequence = frame
+                self.writer.write_frame(
+                    stream.getbuffer()[:size], capture_time, sequence)
+                self.sent += 1
+                self.bytes_sent += size
+                self.spares.put(stream)
+        except OSError as e:
+            # Handed to the camera thread by write()
+            self.error = e
+
+    def close(self):
+        """Wait for the queued frames to go out, then end the stream."""
+        # The queue is bounded and a failed sender no longer empties it, so
+        # make room for the end marker rather than wait for it
+        while self.sender.is_alive():
+            try:
+                self.queue.put_nowait(None)
+                break
+            except queue.Full:
+                pass
+            try:
+                self.spares.put(self.queue.get_nowait()[0])
+                self.dropped += 1
+            except queue.Empty:
+                pass
+        self.sender.join()
+        if self.error is not None:
+            raise self.error
+        # Write the terminating 0-length to the connection to let the
+        # server know we're done
+        self.writer.end()
+
+parser = argparse.ArgumentParser(description='Send MJPEG frames to a receiver')
+parser.add_argument('--host', default='Walker', help='where the receiver runs')
+parser.add_argument(
+    '--fixed-quality', action='store_true',
+    help="don't adapt quality, frame rate and size to the link")
+add_camera_argument(parser)
+add_gate_arguments(parser)
+args = parser.parse_args()
+logging.basicConfig(level=logging.INFO)
 client_socket = socket.socket()
-client_socket.connect(('Walker', 8000))
+client_socket.connect((args.host, 8000))
+# Use timestamped version 2 headers if the receiver offers them
+version = negotiate_version(client_socket)
 connection = client_socket.makefile('wb')
 try:
-    output = SplitFrames(connection)
-    with picamera.PiCamera(resolution='VGA', framerate=15) as camera:
+    output = SplitFrames(
+        FrameWriter(connection, version), gate=gate_from_arguments(args))
+    with open_camera(
+            args.fake_camera, resolution=(WIDTH, HEIGHT),
+            framerate=FPS) as camera:
+        levels = make_levels(WIDTH, HEIGHT, FPS)
+        controller = AdaptiveQuality(
+            levels, lambda level: restart_recording(camera, output, level))
         time.sleep(2)
         start = time.time()
-        camera.start_recording(output, format='mjpeg')
-        camera.wait_recording(30)
+        camera.start_recording(output, format='mjpeg', quality=levels[0].quality)
+        while time.time() - start < 30:
+            camera.wait_recording(CONTROL_INTERVAL)
+            if not args.fixed_quality:
+                controller.update(
+                    output.queue.qsize() / output.queue.maxsize,
+                    output.count, output.sent, output.bytes_sent)
         camera.stop_recording()
-        # Write the terminating 0-length to the connection to let the
-        # server know we're done
-        connection.write(struct.pack('<L', 0))
+        captured = time.time()
+        output.close()
 finally:
     connection.close()
     client_socket.close()
     finish = time.time()
-print('Sent %d images in %d seconds at %.2ffps' % (
-    output.count, finish-start, output.count / (finish-start)))
+print('Captured %d images in %d seconds at %.2ffps' % (
+    output.captured, captured-start, output.captured / (captured-start)))
+print('Sent %d images in %d seconds at %.2ffps, dropped %d' % (
+    output.sent, finish-start, output.sent / (finish-start), output.dropped))
+if output.gate is not None:
+    print(output.gate.report())
@@ -1,9 +1,7 @@
-import io
 import socket
-import struct
-from PIL import Image
 import cv2
-import numpy as np
+from decode_pipeline import DecodePipeline
+from frame_receiver import FrameReceiver
 
 # Start a socket listening for connections on 0.0.0.0:8000 (0.0.0.0 means
 # all interfaces)
@@ -11,28 +9,25 @@ server_socket = socket.socket()
 server_socket.bind(('0.0.0.0', 8000))
 server_socket.listen(0)
 
-# Accept a single connection and make a file-like object out of it
-connection = server_socket.accept()[0].makefile('rb')
+# Accept a single connection and receive frames from it into a reused buffer
+connection = server_socket.accept()[0]
+# Each frame is a header giving its length followed by the image data; a zero
+# length ends the stream. Frames are received on one thread and decoded on a
+# pool of others while this one displays them, oldest frames being dropped if
+# we fall behind
+receiver = FrameReceiver(connection)
+pipeline = DecodePipeline(receiver)
 try:
-    while True:
-        # Read the length of the image as a 32-bit unsigned int. If the
-        # length is zero, quit the loop
-        image_len = struct.unpack('<L', connection.read(struct.calcsize('<L')))[0]
-        if not image_len:
-            break
-        # Construct a stream to hold the image data and read the image
-        # data from the connection
-        image_stream = io.BytesIO()
-        image_stream.write(connection.read(image_len))
-        # Rewind the stream, open it as an image with PIL and do some
-        # processing on it
-        image_stream.seek(0)
-        image = Image.open(image_stream)
-        cv_image = np.array(image)
+    for sequence, cv_image in pipeline:
+        # OpenCV decodes to BGR, which is what imshow expects
         cv2.imshow('Stream', cv_image)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
 finally:
+    pipeline.close()
     connection.close()
     server_socket.close()
+    print(pipeline.report())
+    # Latency, drops and jitter, if the sender used version 2 headers
+    print(receiver.stats.snapshot())
@@ -1,8 +1,8 @@
 import io
 import socket
-import struct
 from PIL import Image
 import matplotlib.pyplot as pl
+from frame_receiver import FrameReceiver
 
 # Start a socket listening for connections on 0.0.0.0:8000 (0.0.0.0 means
 # all interfaces)
@@ -10,24 +10,16 @@ server_socket = socket.socket()
 server_socket.bind(('0.0.0.0', 8000))
 server_socket.listen(0)
 
-# Accept a single connection and make a file-like object out of it
-connection = server_socket.accept()[0].makefile('rb')
+# Accept a single connection and receive frames from it into a reused buffer
+connection = server_socket.accept()[0]
+receiver = FrameReceiver(connection)
 try:
     img = None
-    while True:
-        # Read the length of the image as a 32-bit unsigned int. If the
-        # length is zero, quit the loop
-        image_len = struct.unpack('<L', connection.read(struct.calcsize('<L')))[0]
-        if not image_len:
-            break
-        # Construct a stream to hold the image data and read the image
-        # data from the connection
-        image_stream = io.BytesIO()
-        image_stream.write(connection.read(image_len))
-        # Rewind the stream, open it as an image with PIL and do some
-        # processing on it
-        image_stream.seek(0)
-        image = Image.open(image_stream)
+    # Each frame is a header giving its length followed by the image data; a
+    # zero length ends the stream
+    for frame in receiver:
+        # Open the image with PIL and do some processing on it
+        image = Image.open(io.BytesIO(frame))
         print('Image is %dx%d' % image.size)
         if img is None:
             img = pl.imshow(image)
@@ -42,3 +34,5 @@ try:
 finally:
     connection.close()
     server_socket.close()
+    # Latency, drops and jitter, if the sender used version 2 headers
+    print(receiver.stats.snapshot())
@@ -0,0 +1,214 @@
+"""Relay one camera stream from the Pi to any number of viewers.
+
+Run this on a laptop or server. It takes a single stream from the Pi, either
+by fetching /stream.mjpg from stream_cam_over_http.py or by listening for
+stream_cam_rapid.py / stream_cam_client.py to connect as if it were the
+receiver, and serves it again as MJPEG over HTTP and as length-prefixed
+frames, so the Pi does the same work however many people are watching.
+"""
+
+import argparse
+import asyncio
+import logging
+import socket
+import threading
+import time
+import urllib.request
+from async_mjpeg_server import MAX_REQUEST_SIZE, AsyncMJPEGServer
+from frame_protocol import MAGIC, OFFER_TIMEOUT, POLICY_OFFERS, frame_header
+from frame_receiver import FrameReceiver
+from frame_recorder import FrameRecorder
+from frame_ring import MAX_LAG, ClientDelivery, ClientTooSlow, FrameRing
+
+# enough slots for MAX_LAG of frames at up to this rate
+MAX_FPS = 30
+# seconds to wait before reconnecting to the Pi
+RECONNECT_DELAY = 1.0
+
+PAGE = """\
+<html>
+<head>
+<title>Raspberry Pi - Camera (relayed)</title>
+</head>
+<body>
+<center><h1>Raspberry Pi - Camera</h1></center>
+<center><img src="stream.mjpg"></center>
+</body>
+</html>
+"""
+
+
+def pull_mjpeg(url, ring):
+    """Copy frames from an MJPEG-over-HTTP stream into the ring."""
+    with urllib.request.urlopen(url) as response:
+        while True:
+            line = response.readline()
+            if not line:
+                return
+            if not line.startswith(b'--'):
+                continue
+            # Part headers, then a blank line, then the JPEG
+            length = None
+            while True:
+                line = response.readline().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            if length is None:
+                raise ValueError('MJPEG part without a Content-Length')
+            data = response.read(length)
+            if len(data) != length:
+                # Upstream went away mid-frame; don't publish a torn JPEG
+                raise EOFError('MJPEG part cut short: %d of %d bytes' % (
+                    len(data), length))
+            ring.write(data)
+            ring.commit()
+
+
+def accept_frames(port, ring):
+    """Wait for a Pi sender to connect and copy its frames into the ring."""
+    server_socket = socket.socket()
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(('0.0.0.0', port))
+    server_socket.listen(0)
+    try:
+        while True:
+            connection, address = server_socket.accept()
+            logging.info('Sender connected from %s', address)
+            receiver = FrameReceiver(connection)
+            try:
+                for frame in receiver:
+                    ring.write(frame)
+                    ring.commit(receiver.capture_time)
+            finally:
+                connection.close()
+                logging.info(
+                    'Sender %s went away after %d frames: %s', address,
+                    receiver.frames, receiver.stats.snapshot())
+    finally:
+        server_socket.close()
+
+
+def keep_pulling(pull, *args):
+    """Run an upstream reader forever, reconnecting whenever it stops."""
+    while True:
+        try:
+            pull(*args)
+        except (OSError, ValueError, EOFError) as e:
+            logging.warning('Upstream failed: %s', str(e))
+        time.sleep(RECONNECT_DELAY)
+
+
+class RelayServer(AsyncMJPEGServer):
+    """AsyncMJPEGServer that also serves length-prefixed frame consumers.
+
+    Raw consumers connect like a stream_cam_rapid.py sender would be
+    connected to: they get the frame protocol, in version 2 if they offer it.
+    Each consumer chooses its own drop policy in its version 2 offer (see
+    POLICY_OFFERS), and gets policy if it doesn't: 'latest' skips to the
+    newest frame whenever it is ready for one, like the MJPEG viewers;
+    'every' sends each frame in order and only skips frames that have
+    already left the ring. Either way a consumer falling more than max_lag
+    behind is cut off.
+    """
+
+    def __init__(self, ring, page, max_lag=MAX_LAG, policy='latest'):
+        super(RelayServer, self).__init__(ring, page, max_lag)
+        self.policy = policy
+        self.raw_clients = set()
+
+    def stats(self):
+        stats = super(RelayServer, self).stats()
+        stats['raw_clients'] = [client.stats() for client in self.raw_clients]
+        return stats
+
+    async def serve_relay(self, host, http_port, raw_port):
+        self._listen_for_frames()
+        http = await asyncio.start_server(
+            self.handle_client, host, http_port, limit=MAX_REQUEST_SIZE)
+        raw = await asyncio.start_server(self.handle_raw_client, host, raw_port)
+        try:
+            async with http, raw:
+                await asyncio.gather(http.serve_forever(), raw.serve_forever())
+        finally:
+            self.ring.listeners.remove(self._frame_committed)
+
+    async def handle_raw_client(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        # FrameReceiver offers version 2 as soon as it connects
+        policy = self.policy
+        try:
+            offer = await asyncio.wait_for(
+                reader.readexactly(len(MAGIC)), OFFER_TIMEOUT)
+            version = 2 if offer == MAGIC or offer in POLICY_OFFERS else 1
+            policy = POLICY_OFFERS.get(offer, policy)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            version = 1
+        writer.transport.set_write_buffer_limits(high=0)
+        client = ClientDelivery(self.ring, address, self.max_lag)
+        take = client.take_next if policy == 'every' else client.take_latest
+        self.raw_clients.add(client)
+        logging.info(
+            'Raw consumer %s connected (version %d, %s)', address, version,
+            policy)
+        try:
+            while True:
+                frame = take()
+                if frame is None:
+                    await self.new_frame.wait()
+                    continue
+                writer.write(frame_header(
+                    version, len(frame), client.sequence,
+                    self.ring.capture_time(client.sequence)))
+                writer.write(frame)
+                try:
+                    await asyncio.wait_for(writer.drain(), self.max_lag)
+                except asyncio.TimeoutError:
+                    raise ClientTooSlow(
+                        'frame %d not sent within %.2fs' % (
+                            client.sequence, self.max_lag))
+                client.frame_sent(len(frame))
+        except (ClientTooSlow, ConnectionError) as e:
+            logging.warning(
+                'Removed raw consumer %s after %d frames, %d dropped: %s',
+                address, client.sent, client.dropped, str(e))
+        finally:
+            self.raw_clients.discard(client)
+            # Not close(), which would flush views of slots that may be reused
+            writer.transport.abort()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    upstream = parser.add_mutually_exclusive_group(required=True)
+    upstream.add_argument(
+        '--mjpeg-url', help='e.g. http://raspberrypi:8000/stream.mjpg')
+    upstream.add_argument(
+        '--listen', type=int, metavar='PORT',
+        help='accept a length-prefixed stream from the Pi on this port')
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--raw-port', type=int, default=8001)
+    parser.add_argument(
+        '--raw-policy', choices=['latest', 'every'], default='latest',
+        help='for raw consumers that do not choose: skip to the newest frame, '
+             'or send every frame while keeping up')
+    parser.add_argument('--max-lag', type=float, default=MAX_LAG)
+    parser.add_argument(
+        '--record', metavar='DIRECTORY',
+        help='also record the stream into segment files here')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    ring = FrameRing(slots=int(args.max_lag * MAX_FPS) + 2)
+    if args.mjpeg_url:
+        upstream_args = (pull_mjpeg, args.mjpeg_url, ring)
+    else:
+        upstream_args = (accept_frames, args.listen, ring)
+    threading.Thread(
+        target=keep_pulling, args=upstream_args, daemon=True).start()
+    if args.record:
+        FrameRecorder(args.record).follow(ring)
+    relay = RelayServer(ring, PAGE, args.max_lag, args.raw_policy)
+    asyncio.run(relay.serve_relay('', args.http_port, args.raw_port))